@@ -0,0 +1,97 @@
+"""
+Background batch writer shared by span export, traffic recording and the cache.
+
+Items go into a bounded queue that one daemon thread drains, handing them to a
+handler in batches. submit() never blocks: when the queue is full the item is
+dropped and counted. Batches are handled one at a time. flush() handles whatever
+is still queued, then waits for the batch the thread is working on, and it is
+registered to run at interpreter exit so nothing accepted is lost on shutdown.
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger("kai.batching")
+
+
+class BatchWriter:
+    def __init__(self, handler, name, max_queue=10000, batch_size=256, flush_interval=0.0):
+        """
+        `handler(batch)` receives a list of items in a worker thread. A batch is
+        sent once it holds `batch_size` items or `flush_interval` seconds after its
+        first item arrived (0: whatever is queued right now).
+        """
+        self.handler = handler
+        self.name = name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._handling = threading.Lock()
+        # Items accepted by submit() and not yet handled (queued or in flight)
+        self._idle = threading.Condition()
+        self._unfinished = 0
+
+    def submit(self, item):
+        """Queue `item`; returns False (and counts it) if it was dropped."""
+        if self._thread is None:
+            self._start()
+        with self._idle:
+            self._unfinished += 1
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            self._done(1)
+            self.dropped += 1
+            return False
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._handle(batch)
+
+    def _handle(self, batch):
+        try:
+            with self._handling:
+                self.handler(batch)
+        except Exception:
+            logger.exception("%s: batch of %d failed", self.name, len(batch))
+        finally:
+            self._done(len(batch))
+
+    def _done(self, count):
+        with self._idle:
+            self._unfinished -= count
+            self._idle.notify_all()
+
+    def flush(self, timeout=5.0):
+        """Handle whatever is queued and wait (up to `timeout`) for the batch in flight."""
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if batch:
+            self._handle(batch)
+        with self._idle:
+            self._idle.wait_for(lambda: self._unfinished <= 0, timeout)
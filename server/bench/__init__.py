@@ -0,0 +1,4 @@
+"""
+Benchmarks for the backend. Each module is runnable with `python -m server.bench.<name>`
+from the repo root and uses stub providers, so no API keys or quota are needed.
+"""
@@ -0,0 +1,170 @@
+"""
+Check that a client disconnect closes the upstream connection promptly.
+
+Starts a deliberately slow stub provider (a router that never answers and an
+ElevenLabs-style endpoint that drips audio), points the app at it, serves the app
+with uvicorn, then for /api/conversation and /api/tts opens a request, drops the
+client connection mid-flight and measures how long the stub keeps its upstream
+connection open. /api/tts is checked on both the single-stream and the chunked
+(parallel) path; for the latter every chunk connection must close. Exits non-zero
+if any exceeds --bound seconds.
+
+    python -m server.bench.disconnect --bound 1.0
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import time
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class SlowProvider:
+    """
+    Minimal HTTP/1.1 server recording when upstream requests of each kind first
+    open and when the last of them closes.
+    """
+
+    def __init__(self):
+        self.opened = {}
+        self.closed = {}
+        self.active = {}
+        self._events = {}
+
+    def reset(self):
+        self.opened.clear()
+        self.closed.clear()
+        self.active.clear()
+        self._events.clear()
+
+    def event(self, kind):
+        return self._events.setdefault(kind, asyncio.Event())
+
+    async def handle(self, reader, writer):
+        head = await reader.readuntil(b"\r\n\r\n")
+        request_line = head.split(b"\r\n", 1)[0].decode()
+        length = 0
+        for line in head.split(b"\r\n")[1:]:
+            if line.lower().startswith(b"content-length:"):
+                length = int(line.split(b":", 1)[1])
+        if length:
+            await reader.readexactly(length)
+        kind = "tts" if "/text-to-speech/" in request_line else "router"
+        self.opened.setdefault(kind, time.monotonic())
+        self.active[kind] = self.active.get(kind, 0) + 1
+        self.event(kind).set()
+
+        dripper = None
+        if kind == "tts":
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: audio/mpeg\r\nTransfer-Encoding: chunked\r\n\r\n")
+
+            async def drip():
+                # ~1 KB every 100 ms: a long synthesis that never finishes on its own
+                while True:
+                    writer.write(b"400\r\n" + b"\xff" * 1024 + b"\r\n")
+                    await writer.drain()
+                    await asyncio.sleep(0.1)
+
+            dripper = asyncio.ensure_future(drip())
+        # The router stub never answers; either way, wait for the app to hang up
+        try:
+            while await reader.read(1024):
+                pass
+        except ConnectionError:
+            pass
+        self.active[kind] -= 1
+        if not self.active[kind]:
+            self.closed[kind] = time.monotonic()
+        if dripper:
+            dripper.cancel()
+        writer.close()
+
+
+async def _drop_mid_request(port, path, body, wait_for):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    data = json.dumps(body).encode()
+    writer.write(
+        f"POST {path} HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+        f"Content-Length: {len(data)}\r\n\r\n".encode() + data
+    )
+    await writer.drain()
+    await wait_for(reader)
+    dropped = time.monotonic()
+    writer.transport.abort()
+    return dropped
+
+
+async def run(bound):
+    provider = SlowProvider()
+    stub = await asyncio.start_server(provider.handle, "127.0.0.1", 0)
+    stub_port = stub.sockets[0].getsockname()[1]
+    os.environ["KAI_ROUTER_URL"] = f"http://127.0.0.1:{stub_port}/v1/chat/completions"
+    os.environ["ELEVENLABS_BASE_URL"] = f"http://127.0.0.1:{stub_port}"
+    os.environ.setdefault("ELEVENLABS_VOICE_ID", "stub-voice")
+    # Nothing the check does may touch the shared cache, artifact index or usage totals
+    os.environ["KAI_CACHE_PATH"] = "off"
+    os.environ["KAI_STORAGE_INDEX"] = "off"
+    os.environ["KAI_USAGE_PATH"] = "off"
+
+    import uvicorn
+    from server.main import app
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on"))
+    serving = asyncio.ensure_future(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    def upstream_started(kind, streaming):
+        async def wait(reader):
+            await asyncio.wait_for(provider.event(kind).wait(), 10)
+            if streaming:
+                await asyncio.wait_for(reader.read(1), 10)  # audio is reaching the client
+        return wait
+
+    summary = "A long summary to read out loud. " * 20
+    results = []
+    for label, kind, path, body, streaming in (
+        ("/api/conversation", "router", "/api/conversation", {"text": "hello", "history": []}, False),
+        ("/api/tts", "tts", "/api/tts", {"text": summary, "chunked": False}, True),
+        # Chunks are whole clips, so the client drops before any audio arrives
+        ("/api/tts chunked", "tts", "/api/tts", {"text": summary, "chunked": True}, False),
+    ):
+        provider.reset()
+        dropped = await _drop_mid_request(port, path, body, upstream_started(kind, streaming))
+        deadline = time.monotonic() + bound + 5
+        while kind not in provider.closed and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        closed = provider.closed.get(kind)
+        lag = (closed - dropped) if closed else float("inf")
+        results.append((label, lag))
+
+    server.should_exit = True
+    await serving
+    stub.close()
+    await stub.wait_closed()
+
+    ok = True
+    for label, lag in results:
+        passed = lag <= bound
+        ok &= passed
+        print(f"{label:<20} upstream closed {lag * 1000:8.1f} ms after client disconnect  {'OK' if passed else 'FAIL'}")
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Verify upstream work is cancelled on client disconnect.")
+    parser.add_argument("--bound", type=float, default=1.0, help="max seconds the upstream may stay open")
+    args = parser.parse_args(argv)
+    sys.exit(0 if asyncio.run(run(args.bound)) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Lite vs ReportLab summary PDF backends: cold import time, render time, output size.
+
+Cold import is measured in a fresh interpreter per run (what a serverless cold
+start pays); render time is the median over warm in-process renders.
+
+    python -m server.bench.pdf --runs 5 --renders 50
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+from server.pdf import render_summary_pdf
+
+SAMPLE_SUMMARY = """# Kai Session Summary
+
+## Key Goals
+- Speak up with confidence in weekly team meetings.
+- Feel calm and prepared rather than anxious beforehand.
+
+## Major Breakthroughs
+- Realized the anxiety comes from fear of being judged, not from lack of ideas.
+- Identified that preparing two talking points in advance already helps a lot.
+- Recalled a past presentation that went well and what made it work.
+
+## Actionable Next Steps
+- Before Monday's meeting, write down two points to contribute.
+- Share at least one of them in the first fifteen minutes.
+- Afterwards, note what went well and one thing to try next time.
+"""
+
+# Statement each backend needs before it can render
+_IMPORTS = {
+    "lite": "import server.pdf",
+    "reportlab": (
+        "from reportlab.lib.pagesizes import letter\n"
+        "from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, ListFlowable, ListItem\n"
+        "from reportlab.lib.styles import getSampleStyleSheet"
+    ),
+}
+
+
+def cold_import_ms(backend, runs):
+    code = (
+        "import time\n"
+        "t = time.perf_counter()\n"
+        f"{_IMPORTS[backend]}\n"
+        "print((time.perf_counter() - t) * 1000)\n"
+    )
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        samples.append(float(out.stdout.strip().splitlines()[-1]))
+    return statistics.median(samples)
+
+
+def render_ms(backend, renders, summary_md):
+    render_summary_pdf(summary_md, backend)  # warm-up (lazy imports, caches)
+    samples = []
+    for _ in range(renders):
+        t = time.perf_counter()
+        render_summary_pdf(summary_md, backend)
+        samples.append((time.perf_counter() - t) * 1000)
+    return statistics.median(samples)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark summary PDF backends.")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per cold-import measurement")
+    parser.add_argument("--renders", type=int, default=50, help="warm renders per backend")
+    args = parser.parse_args(argv)
+
+    print(f"{'backend':<10}{'cold_import_ms':>16}{'render_ms':>11}{'bytes':>8}")
+    for backend in ("lite", "reportlab"):
+        try:
+            # Import check first: render_summary_pdf would silently fall back to lite
+            cold = cold_import_ms(backend, args.runs)
+            size = len(render_summary_pdf(SAMPLE_SUMMARY, backend))
+            warm = render_ms(backend, args.renders, SAMPLE_SUMMARY)
+        except (ImportError, subprocess.CalledProcessError) as e:
+            print(f"{backend:<10}unavailable ({e})")
+            continue
+        print(f"{backend:<10}{cold:>16.1f}{warm:>11.2f}{size:>8}")
+
+
+if __name__ == "__main__":
+    main()
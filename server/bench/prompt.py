@@ -0,0 +1,94 @@
+"""
+Static vs stage-aware coaching prompt: prompt tokens per turn (and, with --live,
+the router's reported prompt_tokens and upstream latency).
+
+Offline numbers use the ~4 chars/token estimate over a scripted GROW session,
+with each request shaped like the client's: the history opens with its greeting,
+already ends with the new user message, and is cut to the handler's 8 rows.
+--live sends each turn to the router under both modes and needs REQUESTY_API_KEY.
+
+    python -m server.bench.prompt
+    python -m server.bench.prompt --live
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from server.prompts import build_coaching_prompt, estimate_tokens
+
+# The client's opening line, already in the history when the user first speaks
+GREETING = "Hello, I'm Kai. It's good to hear from you. What's on your mind today?"
+# Rows of history /api/conversation keeps
+HISTORY_ROWS = 8
+
+# A typical session walking through the GROW stages (user text, assistant reply)
+SESSION = [
+    ("Hi Kai", "Hello! It's lovely to meet you. What's on your mind today?"),
+    ("I want to feel less anxious in team meetings.", "That sounds important. What would you like to achieve in those meetings?"),
+    ("To speak up with confidence.", "What will it look, sound, and feel like when you have that confidence?"),
+    ("I'd share ideas calmly and people would listen.", "Lovely. What's happening now regarding that goal?"),
+    ("I stay quiet and overthink.", "What, if anything, is stopping you from speaking up right now?"),
+    ("Fear of sounding stupid.", "What resources do you already have that could help you?"),
+    ("I prepare well and know my work.", "What are all the possible things you could do to use that preparation?"),
+    ("Write talking points, or ask a colleague to prompt me.", "What would you do if you knew you couldn't fail?"),
+    ("I'd speak first.", "What is the very first small step you will take?"),
+    ("Write two points before Monday's meeting.", "How will you know you've successfully achieved your goal? What will be the evidence?"),
+]
+
+
+def _turns():
+    """Yield (history_messages, user_text) for each turn of SESSION, as the handler sees them."""
+    history = [{"role": "assistant", "content": GREETING}]
+    for user_text, reply in SESSION:
+        history.append({"role": "user", "content": user_text})
+        yield history[-HISTORY_ROWS:], user_text
+        history.append({"role": "assistant", "content": reply})
+
+
+def offline():
+    print(f"{'turn':>4}  {'stage':<8}{'static_tok':>11}{'dynamic_tok':>12}{'saved':>7}")
+    static_total = dynamic_total = 0
+    for i, (history, user_text) in enumerate(_turns(), start=1):
+        static_prompt, _ = build_coaching_prompt(history, user_text, mode="static")
+        dynamic_prompt, stage = build_coaching_prompt(history, user_text, mode="dynamic")
+        s, d = estimate_tokens(static_prompt), estimate_tokens(dynamic_prompt)
+        static_total += s
+        dynamic_total += d
+        print(f"{i:>4}  {stage:<8}{s:>11}{d:>12}{(s - d) / s:>7.0%}")
+    print(f"system prompt tokens per session: static {static_total}, dynamic {dynamic_total} "
+          f"({(static_total - dynamic_total) / static_total:.0%} fewer)")
+
+
+async def live():
+    from server.main import call_router
+
+    rows = {"static": [], "dynamic": []}
+    for history, user_text in _turns():
+        for mode in rows:
+            system_prompt, _ = build_coaching_prompt(history, user_text, mode=mode)
+            payload = {
+                "model": "google/gemini-1.5-flash-latest",
+                "messages": [{"role": "system", "content": system_prompt}, *history, {"role": "user", "content": user_text}],
+            }
+            started = time.perf_counter()
+            resp = await call_router(payload, timeout=60)
+            elapsed = (time.perf_counter() - started) * 1000
+            usage = resp.get("usage") or {}
+            rows[mode].append((usage.get("prompt_tokens", 0), elapsed))
+    print(f"{'mode':<9}{'prompt_tok/turn':>16}{'p50_latency_ms':>16}")
+    for mode, samples in rows.items():
+        print(f"{mode:<9}{statistics.fmean(t for t, _ in samples):>16.0f}{statistics.median(ms for _, ms in samples):>16.0f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare static and stage-aware coaching prompts.")
+    parser.add_argument("--live", action="store_true", help="also measure against the real router")
+    args = parser.parse_args(argv)
+    offline()
+    if args.live:
+        asyncio.run(live())
+
+
+if __name__ == "__main__":
+    main()
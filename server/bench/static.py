@@ -0,0 +1,175 @@
+"""
+Static serving throughput and server CPU per MB: Starlette's StaticFiles (the
+previous mounts) vs server/static_files.py.
+
+For each mode, serves the full app with `python -m server.serve` (one worker),
+its static mounts pointed at a temporary directory of generated uuid-named
+artifacts (MP3-sized clips and small PDFs), and fetches them with a fixed
+concurrency; a share of
+requests carry a Range header, like an audio element seeking. Server CPU is read
+from /proc (or psutil) before and after the run. Browser-side wins from
+`immutable` (requests never made at all) are not counted here.
+
+    python -m server.bench.static -n 3000 --concurrency 16
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+from server.bench.workers import _free_port, _wait_for_port
+
+MODES = ("starlette", "immutable")
+
+
+def app_factory():
+    """
+    `uvicorn --factory` target: the real app with its static mounts serving
+    KAI_BENCH_STATIC_DIR, through StaticFiles when KAI_BENCH_STATIC=starlette.
+    """
+    import server.main as main_module
+
+    directory = os.environ["KAI_BENCH_STATIC_DIR"]
+    if os.getenv("KAI_BENCH_STATIC") == "starlette":
+        from fastapi.staticfiles import StaticFiles
+
+        static_app = StaticFiles(directory=directory)
+    else:
+        from server.static_files import ImmutableStaticFiles
+
+        static_app = ImmutableStaticFiles(directory)
+    for route in main_module.app.routes:
+        if getattr(route, "path", None) in ("/static", "/api/static"):
+            route.app = static_app
+    return main_module.app
+
+
+def _cpu_seconds(pid):
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+    except OSError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        times = psutil.Process(pid).cpu_times()
+        return times.user + times.system
+
+
+def _make_artifacts(root, clips, pdfs, seed):
+    """Write uuid-named fixtures: clips of 20-280 KB (a spoken reply) and 2-6 KB PDFs."""
+    rng = random.Random(seed)
+    paths = []
+    for kind, suffix, count, low, high in (("audio", ".mp3", clips, 20, 280), ("docs", ".pdf", pdfs, 2, 6)):
+        os.makedirs(os.path.join(root, kind), exist_ok=True)
+        for _ in range(count):
+            name = f"{uuid.UUID(int=rng.getrandbits(128), version=4)}{suffix}"
+            with open(os.path.join(root, kind, name), "wb") as f:
+                f.write(rng.randbytes(rng.randint(low, high) * 1024))
+            paths.append(f"/static/{kind}/{name}")
+    return paths
+
+
+async def _load(port, paths, n, concurrency, range_share, seed):
+    import httpx
+
+    rng = random.Random(seed)
+    plan = [(rng.choice(paths), rng.random() < range_share) for _ in range(n)]
+    latencies = []
+    transferred = 0
+    errors = 0
+    queue = iter(plan)
+
+    async def worker(client):
+        nonlocal transferred, errors
+        for path, ranged in queue:
+            headers = {"Range": "bytes=0-65535"} if ranged else {}
+            started = time.perf_counter()
+            resp = await client.get(path, headers=headers)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if resp.status_code not in (200, 206):
+                errors += 1
+            transferred += len(resp.content)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=30) as client:
+        # Warm up: first-touch stat/read costs aren't the steady state
+        for path in paths:
+            await client.get(path)
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        wall_s = time.perf_counter() - started
+    return wall_s, transferred, errors, latencies
+
+
+def run_once(mode, root, paths, args):
+    port = _free_port()
+    env = dict(
+        os.environ, KAI_BENCH_STATIC=mode, KAI_BENCH_STATIC_DIR=root,
+        KAI_CACHE_PATH="off", KAI_STORAGE_INDEX="off", KAI_USAGE_PATH="off",
+    )
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "server.serve", "--app", "server.bench.static:app_factory", "--factory",
+         "--host", "127.0.0.1", "--port", str(port), "--workers", "1"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        if not _wait_for_port(port):
+            raise RuntimeError(f"{mode} server did not start")
+        time.sleep(1.0)
+        cpu_before = _cpu_seconds(proc.pid)
+        wall_s, transferred, errors, latencies = asyncio.run(
+            _load(port, paths, args.n, args.concurrency, args.range_share, args.seed)
+        )
+        cpu_after = _cpu_seconds(proc.pid)
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+    mb = transferred / (1024 * 1024)
+    cpu_s = None if cpu_before is None or cpu_after is None else cpu_after - cpu_before
+    return {
+        "mode": mode,
+        "errors": errors,
+        "rps": args.n / wall_s,
+        "mb_s": mb / wall_s,
+        "p50_ms": statistics.median(latencies),
+        "cpu_ms_per_mb": None if cpu_s is None else cpu_s * 1000 / mb,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare static serving implementations.")
+    parser.add_argument("-n", type=int, default=3000, help="requests per mode")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--range-share", type=float, default=0.2, help="fraction of requests with a Range header")
+    parser.add_argument("--clips", type=int, default=50, help="generated audio clips")
+    parser.add_argument("--pdfs", type=int, default=10, help="generated PDFs")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="kai-bench-static-") as root:
+        paths = _make_artifacts(root, args.clips, args.pdfs, args.seed)
+        print(f"{len(paths)} files, {args.n} requests per mode, concurrency {args.concurrency}, "
+              f"{args.range_share:.0%} ranged")
+        rows = [run_once(mode, root, paths, args) for mode in MODES]
+    print(f"{'mode':<11}{'err':>5}{'req/s':>9}{'MB/s':>8}{'p50_ms':>9}{'cpu_ms/MB':>11}")
+    for r in rows:
+        cpu = "n/a" if r["cpu_ms_per_mb"] is None else f"{r['cpu_ms_per_mb']:.1f}"
+        print(f"{r['mode']:<11}{r['errors']:>5}{r['rps']:>9.0f}{r['mb_s']:>8.1f}{r['p50_ms']:>9.1f}{cpu:>11}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Sequential vs parallel chunked TTS: time to complete audio for a ~2,000-character
+spoken summary, through /api/tts in-process.
+
+ElevenLabs is replaced by a stub whose latency follows a simple model of the real
+service: a fixed time to first byte plus generation time proportional to the text
+length, with audio delivered progressively. Tune it with --ttfb and --chars-per-s.
+
+    python -m server.bench.tts_chunked
+    python -m server.bench.tts_chunked --chars 3000 --concurrency 4
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+SUMMARY_PARAGRAPH = (
+    "Today you explored why team meetings leave you feeling anxious. You noticed that you stay quiet "
+    "and overthink, mostly out of a fear of sounding unprepared. At the same time, you recognised real "
+    "strengths: you prepare carefully and you know your work well. "
+)
+BYTES_PER_CHAR = 64
+PART_BYTES = 4096
+
+
+class _LatencyModelTTS:
+    def __init__(self, ttfb, chars_per_s):
+        self.ttfb = ttfb
+        self.chars_per_s = chars_per_s
+        self.calls = 0
+
+    async def stream(self, text, voice_id=None, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.ttfb)
+        total = len(text) * BYTES_PER_CHAR
+        parts = max(-(-total // PART_BYTES), 1)
+        pause = len(text) / self.chars_per_s / parts
+        for _ in range(parts):
+            await asyncio.sleep(pause)
+            yield b"\xff" * PART_BYTES
+
+
+class _LatencyModelElevenLabs:
+    def __init__(self, ttfb, chars_per_s):
+        self.text_to_speech = _LatencyModelTTS(ttfb, chars_per_s)
+
+
+def summary_text(chars):
+    paragraphs = []
+    while sum(len(p) + 2 for p in paragraphs) < chars:
+        paragraphs.append(SUMMARY_PARAGRAPH.strip())
+    return "\n\n".join(paragraphs)[:chars].rsplit(" ", 1)[0] + "."
+
+
+async def measure(client, text, chunked):
+    # ASGITransport hands back the body only once the app has finished it, so this
+    # is time to complete audio (time to first byte needs a real server)
+    started = time.perf_counter()
+    resp = await client.post("/api/tts", json={"text": text, "chunked": chunked})
+    resp.raise_for_status()
+    return time.perf_counter() - started, len(resp.content)
+
+
+async def run(args):
+    import httpx
+    import server.main as main_module
+    from server import tts_chunks
+
+    fake = _LatencyModelElevenLabs(args.ttfb, args.chars_per_s)
+    main_module.elevenlabs_client = fake
+    tts_chunks.CONCURRENCY = args.concurrency
+    text = summary_text(args.chars)
+    chunks = tts_chunks.split_text(text)
+    print(f"text {len(text)} chars -> {len(chunks)} chunks {[len(c) for c in chunks]}, concurrency {args.concurrency}")
+    print(f"latency model: ttfb {args.ttfb}s + chars / {args.chars_per_s:g} per second\n")
+
+    transport = httpx.ASGITransport(app=main_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        print(f"{'mode':<12}{'complete_s':>11}{'audio_kb':>10}{'calls':>7}")
+        for label, chunked in (("sequential", False), ("chunked", True)):
+            totals = []
+            fake.text_to_speech.calls = 0
+            for _ in range(args.runs):
+                total, size = await measure(client, text, chunked)
+                totals.append(total)
+            calls = fake.text_to_speech.calls // args.runs
+            print(f"{label:<12}{statistics.median(totals):>11.2f}{size / 1024:>10.0f}{calls:>7}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare sequential and parallel chunked TTS.")
+    parser.add_argument("--chars", type=int, default=2000, help="length of the synthetic summary")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=3)
+    parser.add_argument("--ttfb", type=float, default=0.35, help="stub seconds to first audio byte")
+    parser.add_argument("--chars-per-s", type=float, default=250, help="stub generation speed")
+    args = parser.parse_args(argv)
+    # Every run must reach the stub rather than the audio cache
+    os.environ["KAI_CACHE_PATH"] = "off"
+    os.environ["KAI_STORAGE_INDEX"] = "off"
+    os.environ["KAI_USAGE_PATH"] = "off"
+    os.environ.setdefault("ELEVENLABS_VOICE_ID", "bench-voice")
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
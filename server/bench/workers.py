@@ -0,0 +1,95 @@
+"""
+Throughput of 1 vs N uvicorn workers on the benchmark workload.
+
+Starts `python -m server.serve` with the stubbed app (server.replay:stubbed_app)
+for each worker count, replays the workload over HTTP, and prints req/s and
+latency percentiles side by side. The shared cache is disabled for the servers
+so every request does its full (stubbed) upstream wait.
+
+    python -m server.bench.workers --workers 1 4 --rate 20 -n 200
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from server.bench.workload import load_workload
+from server.replay import replay, summarize
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for_port(port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def run_once(workers, records, speed):
+    port = _free_port()
+    env = dict(os.environ, KAI_CACHE_PATH="off", KAI_STORAGE_INDEX="off", KAI_USAGE_PATH="off")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "server.serve", "--app", "server.replay:stubbed_app", "--factory",
+         "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers)],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        if not _wait_for_port(port):
+            raise RuntimeError(f"server with {workers} worker(s) did not start")
+        # Give every worker time to import the app before measuring
+        time.sleep(1.0 + 0.5 * workers)
+        started = time.perf_counter()
+        results = asyncio.run(replay(records, speed=speed, base_url=f"http://127.0.0.1:{port}"))
+        wall_s = time.perf_counter() - started
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+    lat = sorted(ms for _, _, ms in results)
+    errors = sum(1 for _, s, _ in results if not (isinstance(s, int) and s < 400))
+    return {
+        "workers": workers,
+        "requests": len(results),
+        "errors": errors,
+        "wall_s": round(wall_s, 2),
+        "rps": round(len(results) / wall_s, 1),
+        "p50_ms": round(lat[len(lat) // 2], 1),
+        "p99_ms": round(lat[min(len(lat) - 1, int(len(lat) * 0.99))], 1),
+        "per_endpoint": summarize(results, wall_s),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare throughput across worker counts.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 2])
+    parser.add_argument("--trace", default=None, help="replay this JSONL trace instead of the synthetic mix")
+    parser.add_argument("-n", type=int, default=200, help="synthetic request count")
+    parser.add_argument("--rate", type=float, default=20.0, help="synthetic arrival rate (req/s)")
+    parser.add_argument("--speed", type=float, default=1.0, help="arrival-time compression factor")
+    args = parser.parse_args(argv)
+
+    records = load_workload(args.trace, n=args.n, rate=args.rate)
+    rows = [run_once(w, records, args.speed) for w in args.workers]
+    print(f"{'workers':>8}{'reqs':>7}{'err':>5}{'wall_s':>9}{'req/s':>8}{'p50_ms':>10}{'p99_ms':>10}")
+    for r in rows:
+        print(f"{r['workers']:>8}{r['requests']:>7}{r['errors']:>5}{r['wall_s']:>9}{r['rps']:>8}{r['p50_ms']:>10}{r['p99_ms']:>10}")
+
+
+if __name__ == "__main__":
+    main()
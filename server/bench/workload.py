@@ -0,0 +1,50 @@
+"""
+Benchmark workload: a recorded trace when one is given, otherwise a synthetic mix
+shaped like typical sessions (mostly conversation turns, a TTS call per reply,
+occasional summaries and PDFs).
+"""
+import random
+
+from server.replay import load_trace
+
+# (endpoint, weight, upstream_ms)
+_MIX = [
+    ("/api/conversation", 10, 900.0),
+    ("/api/tts", 10, 1200.0),
+    ("/api/summary", 1, 2500.0),
+    ("/api/summary_pdf", 1, 2500.0),
+]
+
+
+def synthetic_trace(n=200, rate=20.0, seed=7):
+    """`n` records arriving as a Poisson process at `rate` requests/second."""
+    rng = random.Random(seed)
+    endpoints = [e for e, _, _ in _MIX]
+    weights = [w for _, w, _ in _MIX]
+    upstream = {e: ms for e, _, ms in _MIX}
+    records = []
+    ts = 0.0
+    for _ in range(n):
+        ts += rng.expovariate(rate)
+        endpoint = rng.choices(endpoints, weights)[0]
+        history_len = rng.randint(0, 16)
+        record = {
+            "ts": round(ts, 3),
+            "method": "POST",
+            "endpoint": endpoint,
+            "upstream_ms": round(upstream[endpoint] * rng.uniform(0.6, 1.4), 1),
+        }
+        if endpoint == "/api/tts":
+            record["text_chars"] = rng.randint(80, 400)
+        else:
+            record["history_len"] = history_len
+            # Vary sizes so summaries/PDFs don't all collapse onto one cache entry
+            record["history_chars"] = history_len * rng.randint(60, 240)
+            if endpoint == "/api/conversation":
+                record["text_chars"] = rng.randint(20, 300)
+        records.append(record)
+    return records
+
+
+def load_workload(trace=None, n=200, rate=20.0):
+    return load_trace(trace) if trace else synthetic_trace(n=n, rate=rate)
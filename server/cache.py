@@ -0,0 +1,196 @@
+"""
+Cross-worker cache backed by a single SQLite database in WAL mode.
+
+Every uvicorn worker opens the same file, so a TTS clip, summary or PDF produced
+by one worker is reused by the others instead of being regenerated per process.
+WAL lets readers proceed while one writer commits; entries carry a TTL and the
+table is trimmed by least-recent access once it exceeds its byte budget.
+
+Nothing here blocks the event loop: request handlers read with `await aget()`
+(one SELECT in a worker thread), while set(), access-time updates, expiry
+deletes and trimming are queued to a single writer thread that commits them in
+batches. A value handed to set() is served from memory until it is written.
+
+Configuration (environment):
+- KAI_CACHE_PATH: database file (default: <tmp>/kai-cache.sqlite3; "off" disables)
+- KAI_CACHE_MAX_MB: size budget before LRU trimming (default 256)
+- KAI_CACHE_TTL: default entry lifetime in seconds (default 86400)
+
+Any SQLite failure degrades to a cache miss; callers never see cache errors.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from server.batching import BatchWriter
+from server.sqlite_store import LocalConnections, resolve_path
+
+logger = logging.getLogger("kai.cache")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    ns TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires REAL NOT NULL,
+    accessed REAL NOT NULL,
+    PRIMARY KEY (ns, key)
+);
+CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+"""
+
+
+def make_key(*parts):
+    """Stable digest of the parts that determine a cached value."""
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(str(part).encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+class SharedCache:
+    def __init__(self, path=None, max_bytes=None, default_ttl=None, max_queue=256, batch_size=64):
+        self.path = resolve_path(path, "KAI_CACHE_PATH", "kai-cache.sqlite3")
+        self.max_bytes = max_bytes or int(float(os.getenv("KAI_CACHE_MAX_MB", "256")) * 1024 * 1024)
+        self.default_ttl = default_ttl or float(os.getenv("KAI_CACHE_TTL", "86400"))
+        self._conns = LocalConnections(self.path, _SCHEMA)
+        self._writes = 0
+        # Values queued by set() but not committed yet: (ns, key) -> value
+        self._unwritten = {}
+        self._lock = threading.Lock()
+        self._writer = BatchWriter(self._apply, "kai-cache-writer", max_queue, batch_size)
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    @property
+    def dropped(self):
+        return self._writer.dropped
+
+    def _conn(self):
+        return self._conns.get()
+
+    # --- Reads ---
+
+    def get(self, ns, key):
+        """Blocking: return cached bytes/str or None on miss, expiry or error."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            value = self._unwritten.get((ns, key))
+        if value is not None:
+            return value
+        now = time.time()
+        try:
+            row = self._conn().execute(
+                "SELECT value, expires FROM cache WHERE ns = ? AND key = ?", (ns, key)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("Cache read failed (%s): %s", ns, e)
+            return None
+        if row is None:
+            return None
+        if row[1] < now:
+            self._submit(("delete", ns, key, None, None))
+            return None
+        self._submit(("touch", ns, key, None, now))
+        return row[0]
+
+    async def aget(self, ns, key):
+        """get() for request handlers: the SELECT runs in a worker thread."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            value = self._unwritten.get((ns, key))
+        if value is not None:
+            return value
+        return await asyncio.to_thread(self.get, ns, key)
+
+    # --- Writes (queued; the writer thread commits them) ---
+
+    def set(self, ns, key, value, ttl=None):
+        """Queue `value` for writing; never blocks, drops the write if the queue is full."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._unwritten[(ns, key)] = value
+        if not self._submit(("set", ns, key, value, time.time() + (ttl or self.default_ttl))):
+            with self._lock:
+                if self._unwritten.get((ns, key)) is value:
+                    del self._unwritten[(ns, key)]
+
+    def _submit(self, op):
+        return self._writer.submit(op)
+
+    def flush(self):
+        """Write whatever is queued or in flight."""
+        self._writer.flush()
+
+    def _apply(self, batch):
+        now = time.time()
+        writes = 0
+        try:
+            conn = self._conn()
+            conn.execute("BEGIN")
+            try:
+                for op, ns, key, value, when in batch:
+                    if op == "set":
+                        conn.execute(
+                            "INSERT OR REPLACE INTO cache (ns, key, value, size, expires, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                            (ns, key, value, len(value), when, now),
+                        )
+                        writes += 1
+                    elif op == "touch":
+                        conn.execute("UPDATE cache SET accessed = ? WHERE ns = ? AND key = ?", (when, ns, key))
+                    else:
+                        conn.execute("DELETE FROM cache WHERE ns = ? AND key = ? AND expires < ?", (ns, key, now))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            writes = 0
+            logger.warning("Cache write failed (%d queued operations): %s", len(batch), e)
+        finally:
+            with self._lock:
+                for op, ns, key, value, _ in batch:
+                    if op == "set" and self._unwritten.get((ns, key)) is value:
+                        del self._unwritten[(ns, key)]
+        if writes:
+            before = self._writes
+            self._writes += writes
+            # Trimming scans the table; amortize it over writes
+            if before // 32 != self._writes // 32:
+                self.trim()
+
+    def trim(self):
+        """Blocking: drop expired entries, then least-recently-accessed ones until under budget."""
+        if not self.enabled:
+            return
+        try:
+            conn = self._conn()
+            conn.execute("DELETE FROM cache WHERE expires < ?", (time.time(),))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            excess = total - self.max_bytes
+            freed = 0
+            victims = []
+            for ns, key, size in conn.execute("SELECT ns, key, size FROM cache ORDER BY accessed"):
+                victims.append((ns, key))
+                freed += size
+                if freed >= excess:
+                    break
+            conn.executemany("DELETE FROM cache WHERE ns = ? AND key = ?", victims)
+        except sqlite3.Error as e:
+            logger.warning("Cache trim failed: %s", e)
+
+
+cache = SharedCache()
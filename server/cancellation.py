@@ -0,0 +1,133 @@
+"""
+Client-disconnect detection and per-request deadlines.
+
+DisconnectMiddleware runs each /api/* request in its own task. Once the request
+body has been read it keeps listening on the ASGI channel; when the client goes
+away (tab closed, barge-in) it cancels that task, which aborts in-flight httpx
+calls to the router and closes provider streams through their `finally` blocks.
+
+Each request also gets a deadline (KAI_REQUEST_DEADLINE seconds, default 60).
+Upstream calls size their timeouts with remaining(); if the deadline passes before
+the response has started, the task is cancelled and the client gets a 504.
+Streams that have already started are bounded by the client instead.
+"""
+import asyncio
+import json
+import logging
+import os
+from contextvars import ContextVar
+from typing import Optional
+
+from server.tracing import current_span
+
+logger = logging.getLogger("kai.cancellation")
+
+# Event-loop time by which the current request must have produced its response
+_deadline: ContextVar[Optional[float]] = ContextVar("kai_request_deadline", default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+def remaining(default=None):
+    """
+    Seconds left for upstream work: the smaller of `default` and the request's
+    remaining deadline (None means unbounded). Raises DeadlineExceeded when spent.
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        return default
+    left = deadline - asyncio.get_running_loop().time()
+    if left <= 0:
+        raise DeadlineExceeded("request deadline exceeded")
+    return left if default is None else min(default, left)
+
+
+class DisconnectMiddleware:
+    def __init__(self, app, deadline=None):
+        self.app = app
+        self.deadline = deadline if deadline is not None else float(os.getenv("KAI_REQUEST_DEADLINE", "60"))
+
+    async def __call__(self, scope, receive, send):
+        if (
+            scope["type"] != "http"
+            or not scope["path"].startswith("/api/")
+            or scope["path"].startswith("/api/static/")
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        loop = asyncio.get_running_loop()
+        disconnected = asyncio.Event()
+        state = {"body_done": False, "started": False, "finished": False, "timed_out": False}
+        watcher = None
+        app_task = None
+
+        async def watch_for_disconnect():
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    disconnected.set()
+                    # After the final body chunk the server reports a disconnect too
+                    if not state["finished"] and not app_task.done():
+                        app_task.cancel()
+                    return
+
+        async def guarded_receive():
+            nonlocal watcher
+            if state["body_done"]:
+                # The watcher owns the channel now; surface its disconnect to the app
+                await disconnected.wait()
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request" and not message.get("more_body", False):
+                state["body_done"] = True
+                watcher = asyncio.ensure_future(watch_for_disconnect())
+            elif message["type"] == "http.disconnect":
+                disconnected.set()
+            return message
+
+        async def tracking_send(message):
+            if message["type"] == "http.response.start":
+                state["started"] = True
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                state["finished"] = True
+            await send(message)
+
+        def on_deadline():
+            if not state["started"] and not app_task.done():
+                state["timed_out"] = True
+                app_task.cancel()
+
+        token = _deadline.set(loop.time() + self.deadline)
+        try:
+            app_task = asyncio.ensure_future(self.app(scope, guarded_receive, tracking_send))
+        finally:
+            _deadline.reset(token)
+        deadline_handle = loop.call_later(self.deadline, on_deadline)
+        try:
+            await app_task
+        except asyncio.CancelledError:
+            root = current_span()
+            if disconnected.is_set() and app_task.cancelled():
+                logger.info("Client disconnected; cancelled %s", scope["path"])
+                if root:
+                    root.set("client.disconnected", True)
+                return
+            if state["timed_out"] and app_task.cancelled():
+                logger.warning("Deadline of %gs exceeded; cancelled %s", self.deadline, scope["path"])
+                if root:
+                    root.set("deadline.exceeded", True)
+                await send({
+                    "type": "http.response.start",
+                    "status": 504,
+                    "headers": [(b"content-type", b"application/json")],
+                })
+                await send({"type": "http.response.body", "body": json.dumps({"detail": "Request deadline exceeded."}).encode()})
+                return
+            raise
+        finally:
+            deadline_handle.cancel()
+            if watcher is not None:
+                watcher.cancel()
@@ -1,24 +1,67 @@
+import asyncio
 import os
-import requests
-from fastapi import FastAPI, HTTPException
-from fastapi.staticfiles import StaticFiles
+import sys
+import logging
+import time
+from contextlib import asynccontextmanager
+import httpx
+from fastapi import FastAPI, Header, HTTPException, Request
 from fastapi.responses import StreamingResponse, Response
 from pydantic import BaseModel
 from dotenv import load_dotenv
-from elevenlabs.client import ElevenLabs
+from elevenlabs.client import AsyncElevenLabs
 import uuid
-import io
+import json
 from typing import Optional
 from fastapi.middleware.cors import CORSMiddleware
+
+# Allow `python server/main.py` as well as `uvicorn server.main:app` from the repo root
+if __package__ in (None, ""):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from server.cache import cache, make_key
+from server.cancellation import DeadlineExceeded, DisconnectMiddleware, remaining
+from server.pdf import pdf_backend, render_summary_pdf
+from server.prompts import build_coaching_prompt, estimate_tokens
+from server.static_files import ImmutableStaticFiles
+from server.storage import STATIC_DIR, store as artifact_store
+from server.tracing import (
+    REQUEST_ID_HEADER,
+    RequestContextMiddleware,
+    configure_logging,
+    current_request_id,
+    span,
+    start_span,
+)
+from server.traffic import TrafficRecorder, note_upstream
+from server.tts_chunks import AUTO_THRESHOLD as TTS_CHUNK_THRESHOLD, ChunkedSynthesis, split_text
+from server.usage import DEGRADED_HEADER, SESSION_HEADER, BudgetExceeded, ledger as usage_ledger
  
-# PDF generation imports are intentionally deferred inside the /api/summary_pdf
-# endpoint to avoid import-time failures in serverless (e.g., missing native deps).
-# See lazy import inside generate_summary_pdf().
+# PDF rendering lives in server/pdf.py: a stdlib-only "lite" writer by default, with
+# ReportLab imported lazily only when KAI_PDF_BACKEND=reportlab (falls back to lite
+# if ReportLab is missing in serverless environments).
 
 # Load environment variables
 load_dotenv()
 
-app = FastAPI()
+configure_logging()
+logger = logging.getLogger("kai")
+
+@asynccontextmanager
+async def lifespan(app):
+    # Keep server/static/{audio,docs} within budget (server/storage.py)
+    sweeper = asyncio.create_task(artifact_store.run_sweeper())
+    # Session usage totals are shared between workers on each flush (server/usage.py)
+    usage_flusher = asyncio.create_task(usage_ledger.run_flusher())
+    yield
+    sweeper.cancel()
+    usage_flusher.cancel()
+    await asyncio.to_thread(usage_ledger.flush)
+    await asyncio.to_thread(artifact_store.flush_touches)
+    if _router_client is not None:
+        await _router_client.aclose()
+
+app = FastAPI(lifespan=lifespan)
 
 # --- Helper to extract text from OpenAI-compatible responses ---
 def extract_message_text(resp_json):
@@ -57,6 +100,106 @@ def extract_message_text(resp_json):
         pass
     return ""
 
+# --- Router call shared by all chat-completion endpoints ---
+ROUTER_URL = os.getenv("KAI_ROUTER_URL", "https://router.requesty.ai/v1/chat/completions")
+
+# One pooled async client per worker; cancelling the awaiting task aborts the request
+# and closes its connection, so disconnected clients stop costing upstream work.
+_router_client = None
+
+def _get_router_client():
+    global _router_client
+    if _router_client is None:
+        _router_client = httpx.AsyncClient(limits=httpx.Limits(max_connections=100, max_keepalive_connections=20))
+    return _router_client
+
+async def call_router(payload, timeout=None):
+    """
+    POST an OpenAI-compatible chat payload to the Requesty router and return the parsed JSON.
+    The timeout is capped by the request deadline (server/cancellation.py).
+    Raises httpx.HTTPStatusError on non-2xx so callers keep their 502 mapping.
+    Kept as a module-level function so tooling (server/replay.py) can swap in a stub.
+    """
+    api_key = os.getenv("REQUESTY_API_KEY")
+    headers = {
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+        # Lets provider-side logs be matched to ours
+        REQUEST_ID_HEADER: current_request_id(),
+    }
+    with span("router.call", model=payload.get("model"), messages=len(payload.get("messages", []))) as s:
+        budget = remaining(timeout)
+        started = time.perf_counter()
+        try:
+            response = await _get_router_client().post(ROUTER_URL, headers=headers, json=payload, timeout=budget)
+        finally:
+            note_upstream((time.perf_counter() - started) * 1000)
+        s.set("http.status_code", response.status_code)
+        response.raise_for_status()
+        resp_json = response.json()
+        usage_ledger.record_tokens(resp_json.get("usage"))
+        return resp_json
+
+def normalize_history(history, limit=None):
+    """
+    Map UI conversation rows to OpenAI-compatible messages: 'model'/'bot'/'ai' become
+    'assistant', UI 'system' rows and empty texts are dropped. `limit` keeps only the
+    most recent rows.
+    """
+    rows = history[-limit:] if limit else history
+    messages = []
+    with span("history.normalize", rows=len(rows)) as s:
+        for msg in rows:
+            if isinstance(msg, dict) and "role" in msg and "text" in msg:
+                role = msg["role"]
+                if role in ("model", "bot", "ai"):
+                    role = "assistant"
+                if role in ("user", "assistant"):
+                    content = str(msg["text"]).strip()
+                    if content:
+                        messages.append({"role": role, "content": content})
+        s.set("messages", len(messages))
+    return messages
+
+# --- Shared summarization (used by /api/summary and /api/summary_pdf) ---
+SUMMARY_SYSTEM_PROMPT = (
+    "You are a highly skilled analyst. Your task is to provide a concise, well-structured summary of the following coaching conversation. "
+    "**Format the entire summary using Markdown.** Use headings for 'Key Goals', 'Major Breakthroughs', and 'Actionable Next Steps', "
+    "and use bullet points for the items in each section."
+)
+
+async def summarize_history(history, limit=None):
+    """
+    Return a Markdown summary of the UI conversation `history` (its last `limit` rows).
+    Cached in the cross-worker cache keyed by the normalized payload, so a summary
+    followed by its PDF (possibly on another worker) costs one upstream call.
+    """
+    messages = [{"role": "system", "content": SUMMARY_SYSTEM_PROMPT}]
+    messages.extend(normalize_history(history, limit=limit))
+
+    payload = {
+        "model": "google/gemini-1.5-flash-latest",
+        "messages": messages
+    }
+
+    key = make_key(json.dumps(payload, sort_keys=True))
+    cached = await cache.aget("summary", key)
+    if cached is not None:
+        return cached.decode("utf-8")
+
+    resp_json = await call_router(payload, timeout=60)
+    with span("response.extract"):
+        summary_text = extract_message_text(resp_json)
+    if not summary_text:
+        return "Summary could not be extracted from the provider response."
+    cache.set("summary", key, summary_text.encode("utf-8"))
+    return summary_text
+
+# --- Middleware (each add_middleware wraps the ones registered before it) ---
+# Innermost: cancel work for clients that went away and enforce request deadlines
+# (server/cancellation.py); its 504 still passes through CORS and the recorder
+app.add_middleware(DisconnectMiddleware)
+
 # --- CORS Configuration ---
 origins = [
     "http://localhost:5173",
@@ -67,15 +210,29 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[REQUEST_ID_HEADER, DEGRADED_HEADER],
 )
 
+# --- Optional traffic recording (see server/traffic.py) ---
+if os.getenv("KAI_TRAFFIC_RECORD"):
+    app.add_middleware(TrafficRecorder, path=os.getenv("KAI_TRAFFIC_RECORD"))
+
+# Outermost: request ids + root span cover everything below (see server/tracing.py)
+app.add_middleware(RequestContextMiddleware)
+
 # --- Client Initialization ---
-elevenlabs_client = ElevenLabs(api_key=os.getenv("ELEVENLABS_API_KEY"))
+elevenlabs_client = AsyncElevenLabs(
+    api_key=os.getenv("ELEVENLABS_API_KEY"),
+    base_url=os.getenv("ELEVENLABS_BASE_URL") or None,
+)
 
 # --- Static File Serving ---
-app.mount("/static", StaticFiles(directory="server/static"), name="static")
+# Immutable caching, ETags, Range and a hot-file memory cache (server/static_files.py);
+# reads are reported to the artifact store so eviction is least-recently-used
+static_files = ImmutableStaticFiles(STATIC_DIR, store=artifact_store)
+app.mount("/static", static_files, name="static")
 # Also mount under /api/static so Vercel routes through the Python Function can serve these files
-app.mount("/api/static", StaticFiles(directory="server/static"), name="static_api")
+app.mount("/api/static", static_files, name="static_api")
 
 # --- Pydantic Models ---
 class ConversationRequest(BaseModel):
@@ -93,65 +250,48 @@ class SummaryRequest(BaseModel):
 # Simple TTS request for playing arbitrary text (e.g., initial greeting)
 class TTSRequest(BaseModel):
     text: str
+    # Split long texts and synthesize chunks in parallel; None decides by length
+    chunked: Optional[bool] = None
+
+# History rows sent once a session nears its token budget (server/usage.py)
+BUDGET_HISTORY_LIMIT = int(os.getenv("KAI_BUDGET_HISTORY_LIMIT", "4"))
+BUDGET_SUMMARY_HISTORY_LIMIT = int(os.getenv("KAI_BUDGET_SUMMARY_HISTORY_LIMIT", "24"))
+
+def _client_address(http_request):
+    """Client IP (the proxy's X-Forwarded-For when trusted by server/serve.py), for sessionless budgets."""
+    return http_request.client.host if http_request.client else None
+
+def _budgeted_history_limit(session, default, reduced, response=None):
+    """History limit for this session's token budget; flags degraded responses, 429 once spent."""
+    try:
+        limit, degraded = usage_ledger.history_limit(session, default, reduced)
+    except BudgetExceeded as e:
+        logger.warning("Session %s: %s", session, e)
+        raise HTTPException(status_code=429, detail=str(e))
+    if degraded and response is not None:
+        response.headers[DEGRADED_HEADER] = "short-history"
+    return limit, degraded
 
 # --- API Endpoint ---
 @app.post("/api/conversation", response_model=ConversationResponse)
-async def handle_conversation(request: ConversationRequest):
+async def handle_conversation(
+    request: ConversationRequest,
+    response: Response,
+    http_request: Request,
+    x_session_id: Optional[str] = Header(None, alias=SESSION_HEADER),
+):
+    session = usage_ledger.begin("conversation", x_session_id, _client_address(http_request))
+    history_limit, _ = _budgeted_history_limit(session, 8, BUDGET_HISTORY_LIMIT, response)
     try:
-        api_key = os.getenv("REQUESTY_API_KEY")
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json",
-        }
-        
-        messages = [
-            {
-                "role": "system",
-                "content": (
-                    """You are Kai, an expert AI NLP coach. Your personality is warm, patient, and deeply curious. Your purpose is to be a "Mindful Mirror," helping users find their own solutions by asking insightful, open-ended questions. NEVER give direct advice.
-
---- CRITICAL RULE: THE FIRST TURN ---
-If this is the very first message from the user in the conversation, your ONLY goal is to greet them warmly and ask what's on their mind. Respond naturally to a greeting.
---- END OF CRITICAL RULE ---
-
-Your Conversational Style (After the first turn):
-- Use a Natural, Thoughtful Cadence.
-- Show Empathy.
-- Keep it Concise and end with a question (unless concluding).
-
-Your Coaching Framework (GROW Model enhanced with Well-Formed Outcome):
-1. Goal: Help the user define a clear, positive goal.
-   Start with: "What would you like to achieve?"
-   Deepen with: "What will it look, sound, and feel like when you have that?"
-
-2. Reality: Help them explore their current situation.
-   Start with: "What's happening now regarding that goal?"
-   Deepen with: "What, if anything, is stopping you?" and "What resources (internal or external) do you already have to help you?"
-
-3. Options: Guide them to brainstorm possibilities.
-   Start with: "What are all the possible things you could do?"
-   Deepen with: "What would you do if you knew you couldn't fail?"
-
-4. Will & Conclude: Help them commit to action and define success.
-   Start with: "What is the very first small step you will take?"
-   Deepen with: "How will you know you've successfully achieved your goal? What will be the evidence?"
-   Conclusion Trigger: Once the user has clearly stated a specific action they will take, affirm their decision and end the conversation gracefully.
-"""
-                )
-            }
-        ]
         # Include only recent user/assistant turns; exclude any UI 'system' rows
-        for message in request.history[-8:]:
-            if 'role' in message and 'text' in message:
-                role = message['role']
-                # Map UI roles to API roles
-                if role in ('model', 'bot', 'ai'):
-                    role = 'assistant'
-                if role in ('user', 'assistant'):
-                    content = str(message['text']).strip()
-                    if content:
-                        messages.append({"role": role, "content": content})
-        
+        history_messages = normalize_history(request.history, limit=history_limit)
+        # Persona + only the GROW stages relevant to where the conversation is (server/prompts.py)
+        with span("prompt.build") as s:
+            system_prompt, stage = build_coaching_prompt(history_messages, request.text)
+            s.set("prompt.stage", stage or "static")
+            s.set("prompt.tokens_est", estimate_tokens(system_prompt))
+        messages = [{"role": "system", "content": system_prompt}]
+        messages.extend(history_messages)
         messages.append({"role": "user", "content": request.text})
 
         # --- THIS IS THE ONLY PART THAT MATTERS ---
@@ -163,16 +303,11 @@ Your Coaching Framework (GROW Model enhanced with Well-Formed Outcome):
         
         # Debug: uncomment to inspect payload shape if needed
         # print("Payload being sent to router:", payload)
-        response = requests.post(
-            "https://router.requesty.ai/v1/chat/completions",
-            headers=headers,
-            json=payload
-        )
+        resp_json = await call_router(payload)
         # --- END OF CRITICAL SECTION ---
 
-        response.raise_for_status()
-        resp_json = response.json()
-        ai_text_response = extract_message_text(resp_json)
+        with span("response.extract"):
+            ai_text_response = extract_message_text(resp_json)
         if not ai_text_response:
             # Provide a sane fallback so the client doesn't crash
             ai_text_response = "I created your summary, but the response format was unexpected."
@@ -180,243 +315,266 @@ Your Coaching Framework (GROW Model enhanced with Well-Formed Outcome):
         # Return text only; audio is generated by /api/tts as a separate streaming call
         return ConversationResponse(text=ai_text_response, audio_url=None)
 
-    except requests.exceptions.HTTPError as http_err:
-        print(f"HTTP error occurred: {http_err}")
-        print(f"Response content: {http_err.response.content.decode()}")
+    except httpx.HTTPStatusError as http_err:
+        logger.error("HTTP error occurred: %s", http_err)
+        logger.error("Response content: %s", http_err.response.content.decode(errors="replace"))
         raise HTTPException(status_code=502, detail="Upstream AI service error.")
+    except (httpx.TimeoutException, DeadlineExceeded) as e:
+        logger.warning("Upstream AI service timed out: %s", e)
+        raise HTTPException(status_code=504, detail="Upstream AI service timed out.")
     except Exception as e:
-        print(f"An unexpected error occurred: {e}")
+        logger.exception("An unexpected error occurred: %s", e)
         raise HTTPException(status_code=500, detail="An internal server error occurred.")
 
 # --- Summary API Endpoint ---
 @app.post("/api/summary")
-async def generate_summary(request: SummaryRequest):
+async def generate_summary(
+    request: SummaryRequest,
+    response: Response,
+    http_request: Request,
+    x_session_id: Optional[str] = Header(None, alias=SESSION_HEADER),
+):
     """
     Generate a concise structured session summary:
     Sections: Key Goals, Major Breakthroughs, Actionable Next Steps.
     """
+    session = usage_ledger.begin("summary", x_session_id, _client_address(http_request))
+    history_limit, _ = _budgeted_history_limit(session, None, BUDGET_SUMMARY_HISTORY_LIMIT, response)
     try:
-        api_key = os.getenv("REQUESTY_API_KEY")
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json",
-        }
-
-        system_prompt = (
-            "You are a highly skilled analyst. Your task is to provide a concise, well-structured summary of the following coaching conversation. "
-            "**Format the entire summary using Markdown.** Use headings for 'Key Goals', 'Major Breakthroughs', and 'Actionable Next Steps', "
-            "and use bullet points for the items in each section."
-        )
-
-        messages = [
-            {"role": "system", "content": system_prompt}
-        ]
-
-        # Normalize conversation roles from the UI to OpenAI-compatible roles
-        for msg in request.history:
-            if isinstance(msg, dict) and "role" in msg and "text" in msg:
-                role = msg["role"]
-                if role in ("model", "bot", "ai"):
-                    role = "assistant"
-                if role in ("user", "assistant"):
-                    content = str(msg["text"]).strip()
-                    if content:
-                        messages.append({"role": role, "content": content})
-
-        payload = {
-            "model": "google/gemini-1.5-flash-latest",
-            "messages": messages
-        }
-
-        response = requests.post(
-            "https://router.requesty.ai/v1/chat/completions",
-            headers=headers,
-            json=payload,
-            timeout=60
-        )
-        response.raise_for_status()
-        resp_json = response.json()
-        summary_text = extract_message_text(resp_json)
-        if not summary_text:
-            summary_text = "Summary could not be extracted from the provider response."
-
+        summary_text = await summarize_history(request.history, limit=history_limit)
         return {"summary_text": summary_text}
 
-    except requests.exceptions.HTTPError as http_err:
-        print(f"HTTP error occurred (summary): {http_err}")
+    except httpx.HTTPStatusError as http_err:
+        logger.error("HTTP error occurred (summary): %s", http_err)
         try:
-            print(f"Response content: {http_err.response.content.decode()}")
+            logger.error("Response content: %s", http_err.response.content.decode(errors="replace"))
         except Exception:
             pass
         raise HTTPException(status_code=502, detail="Upstream AI service error (summary).")
+    except (httpx.TimeoutException, DeadlineExceeded) as e:
+        logger.warning("Upstream AI service timed out (summary): %s", e)
+        raise HTTPException(status_code=504, detail="Upstream AI service timed out (summary).")
     except Exception as e:
-        print(f"An unexpected error occurred (summary): {e}")
+        logger.exception("An unexpected error occurred (summary): %s", e)
         raise HTTPException(status_code=500, detail="An internal server error occurred (summary).")
 
 # --- Summary PDF API Endpoint ---
 @app.post("/api/summary_pdf")
-async def generate_summary_pdf(request: SummaryRequest):
+async def generate_summary_pdf(
+    request: SummaryRequest,
+    http_request: Request,
+    x_session_id: Optional[str] = Header(None, alias=SESSION_HEADER),
+):
     """
     Generate a Markdown-formatted summary (like /api/summary) and deliver it as a PDF file.
     """
+    session = usage_ledger.begin("summary_pdf", x_session_id, _client_address(http_request))
+    history_limit, degraded = _budgeted_history_limit(session, None, BUDGET_SUMMARY_HISTORY_LIMIT)
     try:
         # 1) First, reuse the summarization call to get Markdown text
-        api_key = os.getenv("REQUESTY_API_KEY")
-        headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json",
-        }
-
-        system_prompt = (
-            "You are a highly skilled analyst. Your task is to provide a concise, well-structured summary of the following coaching conversation. "
-            "**Format the entire summary using Markdown.** Use headings for 'Key Goals', 'Major Breakthroughs', and 'Actionable Next Steps', "
-            "and use bullet points for the items in each section."
-        )
+        summary_md = await summarize_history(request.history, limit=history_limit)
 
-        messages = [{"role": "system", "content": system_prompt}]
-        for msg in request.history:
-            if isinstance(msg, dict) and "role" in msg and "text" in msg:
-                role = msg["role"]
-                if role in ("model", "bot", "ai"):
-                    role = "assistant"
-                if role in ("user", "assistant"):
-                    content = str(msg["text"]).strip()
-                    if content:
-                        messages.append({"role": role, "content": content})
+        # 2) Convert basic Markdown to a simple PDF (identical summaries reuse the cached render)
+        file_name = f"{uuid.uuid4()}.pdf"
+        backend = pdf_backend()
+        pdf_key = make_key(backend, summary_md)
+        with span("pdf.render", backend=backend) as s:
+            pdf_bytes = await cache.aget("pdf", pdf_key)
+            s.set("cache_hit", pdf_bytes is not None)
+            if pdf_bytes is None:
+                pdf_bytes = render_summary_pdf(summary_md, backend)
+                cache.set("pdf", pdf_key, pdf_bytes)
+            s.set("bytes", len(pdf_bytes))
 
-        payload = {
-            "model": "google/gemini-1.5-flash-latest",
-            "messages": messages
+        headers = {
+            "Content-Disposition": f'attachment; filename="{file_name}"',
+            "Cache-Control": "no-store"
         }
+        if degraded:
+            headers[DEGRADED_HEADER] = "short-history"
+        return Response(content=pdf_bytes, media_type="application/pdf", headers=headers)
 
-        response = requests.post(
-            "https://router.requesty.ai/v1/chat/completions",
-            headers=headers,
-            json=payload,
-            timeout=60
-        )
-        response.raise_for_status()
-        resp_json = response.json()
-        summary_md = extract_message_text(resp_json)
-        if not summary_md:
-            summary_md = "Summary could not be extracted from the provider response."
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("PDF summary error: %s", e)
+        raise HTTPException(status_code=500, detail="Failed to generate PDF summary.")
 
-        # 2) Convert basic Markdown to a simple PDF
-        file_name = f"{uuid.uuid4()}.pdf"
-        # Write to an in-memory buffer to avoid read-only filesystem on serverless platforms
-        buffer = io.BytesIO()
-        
-        # Lazy import of ReportLab here so /api/tts (and other routes) work even if
-        # ReportLab isn't available in the serverless environment.
+# --- Text-to-Speech helpers ---
+def _tts_request_options(timeout=None):
+    """
+    Per-call ElevenLabs options: request id header and a timeout, `timeout` seconds
+    if given (audio already streaming) or else capped by the request deadline.
+    """
+    options = {"additional_headers": {REQUEST_ID_HEADER: current_request_id()}}
+    budget = timeout if timeout is not None else remaining()
+    if budget is not None:
+        options["timeout_in_seconds"] = max(int(budget), 1)
+    return options
+
+def _tts_http_error(sdk_err):
+    """Map a provider failure to the HTTP error the client understands."""
+    msg = str(sdk_err)
+    logger.error("TTS provider error: %s", msg)
+    if isinstance(sdk_err, (httpx.TimeoutException, DeadlineExceeded)):
+        return HTTPException(status_code=504, detail="TTS provider timed out")
+    lowered = msg.lower()
+    if "quota" in lowered or "quota_exceeded" in lowered:
+        return HTTPException(status_code=429, detail="TTS quota exceeded")
+    if "401" in lowered or "unauthorized" in lowered:
+        return HTTPException(status_code=401, detail="TTS unauthorized")
+    return HTTPException(status_code=502, detail="Upstream TTS provider error")
+
+async def _stream_chunked_tts(text, voice_id, tts_key, chunks):
+    """Synthesize `chunks` concurrently (server/tts_chunks.py) and stream them in order."""
+    stream_span = start_span("tts.stream", chars=len(text), chunks=len(chunks))
+    first_chunk_span = start_span("tts.first_chunk", parent=stream_span)
+    synthesis = ChunkedSynthesis(elevenlabs_client, voice_id, chunks, _tts_request_options, parent_span=stream_span)
+    try:
+        await synthesis.first()
+        first_chunk_span.end()
+    except BaseException as sdk_err:
+        note_upstream(synthesis.waited * 1000)
+        first_chunk_span.end(error=sdk_err)
+        stream_span.end(error=sdk_err)
+        if not isinstance(sdk_err, Exception):
+            raise
+        raise _tts_http_error(sdk_err)
+
+    async def iter_audio():
+        received = []
+        error = None
         try:
-            from reportlab.lib.pagesizes import letter
-            from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, ListFlowable, ListItem
-            from reportlab.lib.styles import getSampleStyleSheet
-            from reportlab.lib import colors
+            async for audio in synthesis.stream():
+                received.append(audio)
+                yield audio
+            cache.set("tts", tts_key, b"".join(received))
         except Exception as e:
-            # If ReportLab cannot be imported on Vercel, fail gracefully with a clear error.
-            raise HTTPException(status_code=503, detail="PDF generation is unavailable in this environment.") from e
-        
-        styles = getSampleStyleSheet()
-        doc = SimpleDocTemplate(buffer, pagesize=letter, title="Kai Session Summary")
-        flow = []
-
-        def add_paragraph(text, style=styles["BodyText"], space=6):
-            flow.append(Paragraph(text, style))
-            flow.append(Spacer(1, space))
-
-        bullets = []
-        for raw_line in summary_md.splitlines():
-            line = raw_line.rstrip()
-            if not line.strip():
-                # flush any pending bullets
-                if bullets:
-                    flow.append(ListFlowable([ListItem(Paragraph(x, styles["BodyText"])) for x in bullets], bulletType="bullet"))
-                    flow.append(Spacer(1, 6))
-                    bullets.clear()
-                flow.append(Spacer(1, 6))
-                continue
-
-            if line.startswith("# "):
-                # flush bullets
-                if bullets:
-                    flow.append(ListFlowable([ListItem(Paragraph(x, styles["BodyText"])) for x in bullets], bulletType="bullet"))
-                    flow.append(Spacer(1, 6))
-                    bullets.clear()
-                add_paragraph(f"<b>{line[2:].strip()}</b>", styles["Heading1"], space=10)
-            elif line.startswith("## "):
-                if bullets:
-                    flow.append(ListFlowable([ListItem(Paragraph(x, styles["BodyText"])) for x in bullets], bulletType="bullet"))
-                    flow.append(Spacer(1, 6))
-                    bullets.clear()
-                add_paragraph(f"<b>{line[3:].strip()}</b>", styles["Heading2"], space=8)
-            elif line.lstrip().startswith(("- ", "* ")):
-                bullets.append(line.lstrip()[2:].strip())
-            else:
-                # normal paragraph
-                if bullets:
-                    flow.append(ListFlowable([ListItem(Paragraph(x, styles["BodyText"])) for x in bullets], bulletType="bullet"))
-                    flow.append(Spacer(1, 6))
-                    bullets.clear()
-                add_paragraph(line, styles["BodyText"], space=6)
-
-        if bullets:
-            flow.append(ListFlowable([ListItem(Paragraph(x, styles["BodyText"])) for x in bullets], bulletType="bullet"))
-            flow.append(Spacer(1, 6))
-            bullets.clear()
-
-        doc.build(flow)
-        buffer.seek(0)
-        
-        return Response(
-            content=buffer.getvalue(),
-            media_type="application/pdf",
-            headers={
-                "Content-Disposition": f'attachment; filename="{file_name}"',
-                "Cache-Control": "no-store"
-            }
-        )
-
-    except Exception as e:
-        print(f"PDF summary error: {e}")
-        raise HTTPException(status_code=500, detail="Failed to generate PDF summary.")
+            # The 200 is already out; end the audio at the last whole chunk
+            error = e
+            logger.error("TTS chunk failed after retries; ending stream early: %s", e)
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            note_upstream(synthesis.waited * 1000)
+            stream_span.set("bytes", sum(len(c) for c in received))
+            stream_span.end(error=error)
+
+    return StreamingResponse(iter_audio(), media_type="audio/mpeg", headers={"Cache-Control": "no-store"})
 
 # --- Text-to-Speech API Endpoint (streaming audio) ---
 @app.post("/api/tts")
-async def tts(request: TTSRequest):
+async def tts(
+    request: TTSRequest,
+    http_request: Request,
+    x_session_id: Optional[str] = Header(None, alias=SESSION_HEADER),
+):
+    session = usage_ledger.begin("tts", x_session_id, _client_address(http_request))
     try:
         text = request.text.strip()
         if not text:
             raise HTTPException(status_code=400, detail="Text is required.")
         voice_id = os.getenv("ELEVENLABS_VOICE_ID")
+
+        # Identical text (e.g. the greeting) is served from the cross-worker cache
+        tts_key = make_key(voice_id, text)
+        cached_audio = await cache.aget("tts", tts_key)
+        if cached_audio is not None:
+            return Response(content=cached_audio, media_type="audio/mpeg", headers={"Cache-Control": "no-store"})
+
+        # Near the session's character budget, long texts go unspoken first; the
+        # client already continues with text only when /api/tts fails
+        try:
+            usage_ledger.check_tts(session, len(text), long_text=len(text) > TTS_CHUNK_THRESHOLD)
+        except BudgetExceeded as e:
+            logger.warning("Session %s: %s", session, e)
+            raise HTTPException(status_code=429, detail=str(e))
+
+        # Long texts (e.g. a spoken summary) are synthesized as parallel chunks
+        chunked = request.chunked if request.chunked is not None else len(text) > TTS_CHUNK_THRESHOLD
+        chunks = split_text(text) if chunked else [text]
+        if len(chunks) > 1:
+            return await _stream_chunked_tts(text, voice_id, tts_key, chunks)
  
-        # Call provider; return a streaming response of the MP3 bytes
+        # Explicit spans: the body is streamed after this handler returns
+        stream_span = start_span("tts.stream", chars=len(text))
+        first_chunk_span = start_span("tts.first_chunk", parent=stream_span)
+        # Time spent pulling from the provider counts as upstream latency
+        waited = 0.0
+
+        # Call provider and wait for the first chunk, so provider errors still map to
+        # status codes before any audio is streamed
+        audio_stream = None
         try:
             audio_stream = elevenlabs_client.text_to_speech.stream(
                 text=text,
                 voice_id=voice_id,
+                request_options=_tts_request_options(),
             )
-        except Exception as sdk_err:
-            msg = str(sdk_err)
-            print(f"TTS provider error: {msg}")
-            lowered = msg.lower()
-            if "quota" in lowered or "quota_exceeded" in lowered:
-                raise HTTPException(status_code=429, detail="TTS quota exceeded")
-            if "401" in lowered or "unauthorized" in lowered:
-                raise HTTPException(status_code=401, detail="TTS unauthorized")
-            raise HTTPException(status_code=502, detail="Upstream TTS provider error")
- 
-        def iter_audio():
-            for chunk in audio_stream:
-                yield chunk
- 
+            started = time.perf_counter()
+            try:
+                first_chunk = await audio_stream.__anext__()
+            except StopAsyncIteration:
+                first_chunk = b""
+            finally:
+                waited += time.perf_counter() - started
+            first_chunk_span.end()
+            # The provider has accepted the text, so it's billed from here on
+            usage_ledger.record_tts_chars(len(text), span=stream_span)
+        except BaseException as sdk_err:
+            # Also reached when the client disconnects while we wait (CancelledError)
+            if audio_stream is not None:
+                await audio_stream.aclose()
+            note_upstream(waited * 1000)
+            first_chunk_span.end(error=sdk_err)
+            stream_span.end(error=sdk_err)
+            if not isinstance(sdk_err, Exception):
+                raise
+            raise _tts_http_error(sdk_err)
+
+        async def iter_audio():
+            nonlocal waited
+            received = [first_chunk] if first_chunk else []
+            error = None
+            try:
+                if first_chunk:
+                    yield first_chunk
+                while True:
+                    started = time.perf_counter()
+                    try:
+                        chunk = await audio_stream.__anext__()
+                    except StopAsyncIteration:
+                        break
+                    finally:
+                        waited += time.perf_counter() - started
+                    received.append(chunk)
+                    yield chunk
+                # Only complete streams are cached
+                cache.set("tts", tts_key, b"".join(received))
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                # On disconnect the response task is cancelled; closing the provider
+                # stream here releases its HTTP connection immediately
+                await audio_stream.aclose()
+                note_upstream(waited * 1000)
+                stream_span.set("bytes", sum(len(c) for c in received))
+                stream_span.end(error=error)
+
         return StreamingResponse(iter_audio(), media_type="audio/mpeg", headers={"Cache-Control": "no-store"})
     except HTTPException:
         raise
     except Exception as e:
-        print("TTS route error:", e)
+        logger.exception("TTS route error: %s", e)
         raise HTTPException(status_code=500, detail="Failed to synthesize speech.")
 
+# --- Metrics ---
+@app.get("/api/metrics")
+async def metrics():
+    return {"storage": await asyncio.to_thread(artifact_store.stats), "usage": usage_ledger.stats()}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
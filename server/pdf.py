@@ -0,0 +1,269 @@
+"""
+Summary PDF rendering.
+
+The summary Markdown is tiny and simple (headings, bullets, paragraphs), so two
+backends are provided:
+- "lite" (default): a minimal pure-Python writer producing text-only PDFs with the
+  standard Type1 Helvetica fonts, line wrapping, and Flate-compressed pages.
+  No imports beyond the stdlib, so cold starts stay cheap.
+- "reportlab": the richer ReportLab/platypus layout, imported lazily. If ReportLab
+  is not installed (e.g. on serverless), rendering falls back to "lite".
+
+Select with KAI_PDF_BACKEND=lite|reportlab.
+"""
+import io
+import logging
+import os
+import re
+import zlib
+
+logger = logging.getLogger("kai.pdf")
+
+BACKENDS = ("lite", "reportlab")
+
+
+def pdf_backend():
+    backend = os.getenv("KAI_PDF_BACKEND", "lite").strip().lower()
+    return backend if backend in BACKENDS else "lite"
+
+
+def parse_summary_markdown(summary_md):
+    """
+    Split the summary into layout blocks shared by both backends:
+    ("h1", text), ("h2", text), ("bullets", [text, ...]), ("p", text), ("space", None).
+    A blank line ends a bullet list and adds vertical space.
+    """
+    blocks = []
+    bullets = []
+
+    def flush():
+        if bullets:
+            blocks.append(("bullets", list(bullets)))
+            bullets.clear()
+
+    for raw_line in summary_md.splitlines():
+        line = raw_line.rstrip()
+        if not line.strip():
+            flush()
+            blocks.append(("space", None))
+        elif line.startswith("# "):
+            flush()
+            blocks.append(("h1", line[2:].strip()))
+        elif line.startswith("## "):
+            flush()
+            blocks.append(("h2", line[3:].strip()))
+        elif line.lstrip().startswith(("- ", "* ")):
+            bullets.append(line.lstrip()[2:].strip())
+        else:
+            flush()
+            blocks.append(("p", line))
+    flush()
+    return blocks
+
+
+def render_summary_pdf(summary_md, backend=None):
+    """Render the summary Markdown to PDF bytes with the selected backend."""
+    backend = backend or pdf_backend()
+    if backend == "reportlab":
+        try:
+            return _render_reportlab(summary_md)
+        except ImportError as e:
+            logger.warning("ReportLab unavailable, using lite PDF backend: %s", e)
+    return _render_lite(summary_md)
+
+
+# --- ReportLab backend ---
+def _render_reportlab(summary_md):
+    # Lazy import so other routes (and the lite backend) work without ReportLab
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, ListFlowable, ListItem
+    from reportlab.lib.styles import getSampleStyleSheet
+
+    # Write to an in-memory buffer to avoid read-only filesystem on serverless platforms
+    buffer = io.BytesIO()
+    styles = getSampleStyleSheet()
+    doc = SimpleDocTemplate(buffer, pagesize=letter, title="Kai Session Summary")
+    flow = []
+
+    for kind, value in parse_summary_markdown(summary_md):
+        if kind == "space":
+            flow.append(Spacer(1, 6))
+        elif kind == "h1":
+            flow.append(Paragraph(f"<b>{value}</b>", styles["Heading1"]))
+            flow.append(Spacer(1, 10))
+        elif kind == "h2":
+            flow.append(Paragraph(f"<b>{value}</b>", styles["Heading2"]))
+            flow.append(Spacer(1, 8))
+        elif kind == "bullets":
+            flow.append(ListFlowable([ListItem(Paragraph(x, styles["BodyText"])) for x in value], bulletType="bullet"))
+            flow.append(Spacer(1, 6))
+        else:
+            flow.append(Paragraph(value, styles["BodyText"]))
+            flow.append(Spacer(1, 6))
+
+    doc.build(flow)
+    return buffer.getvalue()
+
+
+# --- Lite backend ---
+PAGE_WIDTH, PAGE_HEIGHT = 612, 792  # US Letter, points
+MARGIN = 72
+BULLET_INDENT = 18
+
+# (font resource, size, leading, space after) per block kind
+_STYLES = {
+    "h1": ("F2", 18, 22, 10),
+    "h2": ("F2", 14, 18, 8),
+    "p": ("F1", 10, 12, 6),
+    "bullets": ("F1", 10, 12, 6),
+}
+_SPACE = 6
+
+# Glyph widths (1/1000 em) for WinAnsi codes 32..126 from the standard Helvetica AFMs
+_HELVETICA = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+]
+_HELVETICA_BOLD = [
+    278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611,
+    975, 722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 333, 278, 333, 584, 556,
+    333, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889, 611, 611,
+    611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584,
+]
+_WIDTHS = {"F1": _HELVETICA, "F2": _HELVETICA_BOLD}
+_DEFAULT_WIDTH = 556
+
+# Typographic characters the model likes to emit, mapped into WinAnsiEncoding
+_WINANSI = {
+    "‘": 0x91, "’": 0x92, "“": 0x93, "”": 0x94, "•": 0x95,
+    "–": 0x96, "—": 0x97, "…": 0x85, "€": 0x80, "™": 0x99,
+}
+_INLINE_MARKUP = re.compile(r"(\*\*|__|`)")
+
+
+def _encode(text):
+    """Encode to WinAnsi bytes; characters outside it become '?'."""
+    out = bytearray()
+    for ch in text:
+        code = _WINANSI.get(ch)
+        if code is None:
+            code = ord(ch)
+            if code > 0xFF or 0x80 <= code < 0xA0:
+                code = ord("?")
+        out.append(code)
+    return bytes(out)
+
+
+def _width(data, font, size):
+    table = _WIDTHS[font]
+    total = 0
+    for b in data:
+        total += table[b - 32] if 32 <= b <= 126 else _DEFAULT_WIDTH
+    return total * size / 1000
+
+
+def _wrap(data, font, size, max_width):
+    """Greedy word wrap of encoded text; words longer than a line are split."""
+    lines = []
+    current = b""
+    for word in data.split(b" "):
+        candidate = word if not current else current + b" " + word
+        if _width(candidate, font, size) <= max_width:
+            current = candidate
+            continue
+        if current:
+            lines.append(current)
+        current = word
+        while _width(current, font, size) > max_width and len(current) > 1:
+            cut = len(current) - 1
+            while cut > 1 and _width(current[:cut], font, size) > max_width:
+                cut -= 1
+            lines.append(current[:cut])
+            current = current[cut:]
+    if current or not lines:
+        lines.append(current)
+    return lines
+
+
+def _pdf_string(data):
+    return b"(" + data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+def _render_lite(summary_md, title="Kai Session Summary"):
+    pages = []
+    ops = []
+    y = PAGE_HEIGHT - MARGIN
+    text_width = PAGE_WIDTH - 2 * MARGIN
+
+    def new_page():
+        nonlocal ops, y
+        if ops:
+            pages.append(b"\n".join(ops))
+        ops = []
+        y = PAGE_HEIGHT - MARGIN
+
+    def draw(x, data, font, size, leading):
+        nonlocal y
+        if y - leading < MARGIN:
+            new_page()
+        y -= leading
+        ops.append(b"BT /%s %d Tf %.2f %.2f Td %s Tj ET" % (font.encode(), size, x, y, _pdf_string(data)))
+
+    for kind, value in parse_summary_markdown(summary_md):
+        if kind == "space":
+            y -= _SPACE
+            continue
+        font, size, leading, after = _STYLES[kind]
+        items = value if kind == "bullets" else [value]
+        for item in items:
+            data = _encode(_INLINE_MARKUP.sub("", item))
+            x = MARGIN
+            width = text_width
+            if kind == "bullets":
+                x += BULLET_INDENT
+                width -= BULLET_INDENT
+            for i, line in enumerate(_wrap(data, font, size, width)):
+                draw(x, line, font, size, leading)
+                if kind == "bullets" and i == 0:
+                    ops.append(b"BT /F1 %d Tf %.2f %.2f Td (\x95) Tj ET" % (size, MARGIN + 6, y))
+        y -= after
+    new_page()
+    if not pages:
+        pages.append(b"")
+
+    # Objects: 1 catalog, 2 page tree, 3-4 fonts, 5 info, then (page, contents) pairs
+    objects = [None] * 5
+    kids = []
+    for content in pages:
+        stream = zlib.compress(content)
+        page_num = len(objects) + 1
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents %d 0 R >>"
+            % (PAGE_WIDTH, PAGE_HEIGHT, page_num + 1)
+        )
+        objects.append(b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        kids.append(b"%d 0 R" % page_num)
+    objects[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objects[1] = b"<< /Type /Pages /Kids [" + b" ".join(kids) + b"] /Count %d >>" % len(kids)
+    objects[2] = b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>"
+    objects[3] = b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>"
+    objects[4] = b"<< /Title " + _pdf_string(_encode(title)) + b" /Producer (Kai) >>"
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for num, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % num + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R /Info 5 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
@@ -0,0 +1,141 @@
+"""
+System prompts for /api/conversation.
+
+The coaching prompt is assembled from precomputed segments: the shared persona and
+style, the first-turn rule (only while the user hasn't spoken yet), and the GROW
+stages that matter right now — the active stage plus its neighbours — instead of
+all four on every turn. The active stage is derived from the most recent assistant
+turns in the history the client already sends, so no per-conversation state has
+to live on (or be shared between) server workers.
+
+KAI_PROMPT_MODE=static restores the full single prompt for A/B comparisons.
+"""
+import os
+import re
+
+PERSONA = """You are Kai, an expert AI NLP coach. Your personality is warm, patient, and deeply curious. Your purpose is to be a "Mindful Mirror," helping users find their own solutions by asking insightful, open-ended questions. NEVER give direct advice.
+"""
+
+FIRST_TURN = """
+--- CRITICAL RULE: THE FIRST TURN ---
+If this is the very first message from the user in the conversation, your ONLY goal is to greet them warmly and ask what's on their mind. Respond naturally to a greeting.
+--- END OF CRITICAL RULE ---
+"""
+
+STYLE = """
+Your Conversational Style (After the first turn):
+- Use a Natural, Thoughtful Cadence.
+- Show Empathy.
+- Keep it Concise and end with a question (unless concluding).
+"""
+
+FRAMEWORK = """
+Your Coaching Framework (GROW Model enhanced with Well-Formed Outcome):"""
+
+STAGE_ORDER = ("goal", "reality", "options", "will")
+
+STAGES = {
+    "goal": """
+1. Goal: Help the user define a clear, positive goal.
+   Start with: "What would you like to achieve?"
+   Deepen with: "What will it look, sound, and feel like when you have that?"
+""",
+    "reality": """
+2. Reality: Help them explore their current situation.
+   Start with: "What's happening now regarding that goal?"
+   Deepen with: "What, if anything, is stopping you?" and "What resources (internal or external) do you already have to help you?"
+""",
+    "options": """
+3. Options: Guide them to brainstorm possibilities.
+   Start with: "What are all the possible things you could do?"
+   Deepen with: "What would you do if you knew you couldn't fail?"
+""",
+    "will": """
+4. Will & Conclude: Help them commit to action and define success.
+   Start with: "What is the very first small step you will take?"
+   Deepen with: "How will you know you've successfully achieved your goal? What will be the evidence?"
+   Conclusion Trigger: Once the user has clearly stated a specific action they will take, affirm their decision and end the conversation gracefully.
+""",
+}
+
+STAGE_TITLES = {"goal": "Goal", "reality": "Reality", "options": "Options", "will": "Will & Conclude"}
+
+# The original all-stages prompt, byte for byte
+STATIC_PROMPT = PERSONA + FIRST_TURN + STYLE + "\n" + FRAMEWORK.lstrip("\n") + "".join(
+    STAGES[s] if i == 0 else "\n" + STAGES[s].lstrip("\n") for i, s in enumerate(STAGE_ORDER)
+)
+
+# Phrases an assistant turn uses while working in each stage (lowercase)
+_STAGE_CUES = {
+    "goal": ("would you like to achieve", "look, sound, and feel", "your goal", "what do you want", "hoping for", "like to change"),
+    "reality": ("happening now", "stopping you", "resources", "currently", "right now", "so far", "getting in the way"),
+    "options": ("possible things", "could do", "couldn't fail", "options", "ideas", "brainstorm", "alternatives", "what else"),
+    "will": ("first small step", "will you take", "commit", "evidence", "successfully achieved", "by when", "next step"),
+}
+_CUE_PATTERNS = {stage: re.compile("|".join(re.escape(c) for c in cues)) for stage, cues in _STAGE_CUES.items()}
+
+
+def _assemble(stage, first_turn):
+    idx = STAGE_ORDER.index(stage)
+    included = STAGE_ORDER[max(idx - 1, 0): idx + 2]
+    parts = [PERSONA]
+    if first_turn:
+        parts.append(FIRST_TURN)
+    parts.append(STYLE)
+    parts.append(FRAMEWORK)
+    parts.extend(STAGES[s] for s in included)
+    parts.append(
+        f"\nThe conversation is currently in the {STAGE_TITLES[stage]} stage; "
+        "move on to the next stage once the user is ready.\n"
+    )
+    return "".join(parts)
+
+
+# Every (stage, first_turn) combination is built once at import
+_PROMPTS = {(stage, first): _assemble(stage, first) for stage in STAGE_ORDER for first in (True, False)}
+
+
+def detect_stage(messages):
+    """
+    Infer the active GROW stage from the assistant turns of normalized `messages`.
+    The most recent turn with any cue wins (ties go to the later stage), so uncued
+    small talk keeps the stage already reached; with no cues anywhere in the
+    history the conversation is still at "goal". /api/conversation passes at
+    most 8 rows, so scanning all of them is cheap.
+    """
+    for msg in reversed(messages):
+        if msg.get("role") != "assistant":
+            continue
+        text = msg.get("content", "").lower()
+        scores = {stage: len(p.findall(text)) for stage, p in _CUE_PATTERNS.items()}
+        best = max(STAGE_ORDER, key=lambda s: (scores[s], STAGE_ORDER.index(s)))
+        if scores[best]:
+            return best
+    return "goal"
+
+
+def prompt_mode():
+    return "static" if os.getenv("KAI_PROMPT_MODE", "dynamic").strip().lower() == "static" else "dynamic"
+
+
+def build_coaching_prompt(messages, user_text=None, mode=None):
+    """
+    Return (system_prompt, stage) for the normalized history `messages` and the
+    new message `user_text`. stage is None in static mode.
+
+    The client appends the new message to the history before posting it, so
+    it is the first turn when the only user row is that message.
+    """
+    if (mode or prompt_mode()) == "static":
+        return STATIC_PROMPT, None
+    earlier = [m for m in messages if m.get("role") == "user"]
+    if earlier and user_text is not None and earlier[-1].get("content") == user_text.strip():
+        earlier.pop()
+    first_turn = not earlier
+    stage = detect_stage(messages)
+    return _PROMPTS[(stage, first_turn)], stage
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token) for logging and comparisons."""
+    return (len(text) + 3) // 4
@@ -0,0 +1,243 @@
+"""
+Replay a recorded traffic trace (see server/traffic.py) against the FastAPI app.
+
+Providers are replaced with stubs that reproduce the recorded upstream latency,
+so the workload exercises our own code paths without spending router or
+ElevenLabs quota. Requests are re-issued at their recorded offsets, optionally
+compressed by --speed (arrival times only; stub latencies stay at 1x).
+
+    python -m server.replay trace.jsonl            # real-time
+    python -m server.replay trace.jsonl --speed 20 # 20x faster arrivals
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+import uuid
+from contextvars import ContextVar
+
+import httpx
+
+from server.usage import SESSION_HEADER
+
+# Recorded upstream latency for the request being replayed, taken from a header
+# the replay client sets; the stub providers below sleep for this long.
+_replay_upstream_ms: ContextVar[float] = ContextVar("kai_replay_upstream_ms", default=0.0)
+
+UPSTREAM_HEADER = "x-replay-upstream-ms"
+
+# Roughly what an ElevenLabs MP3 stream yields per character of input text
+STUB_AUDIO_BYTES_PER_CHAR = 70
+STUB_AUDIO_CHUNK = 4096
+
+
+def load_trace(path, limit=None):
+    records = []
+    with open(path, encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+            if limit and len(records) >= limit:
+                break
+    records.sort(key=lambda r: r.get("ts", 0))
+    return records
+
+
+def synth_body(record):
+    """Build a request body with the recorded shape (sizes only, filler text)."""
+    body = {}
+    history_len = int(record.get("history_len", 0) or 0)
+    if "history_len" in record:
+        per_msg = int(record.get("history_chars", 0) or 0) // max(history_len, 1)
+        body["history"] = [
+            {"role": "user" if i % 2 else "model", "text": "x" * max(per_msg, 1)}
+            for i in range(history_len)
+        ]
+    if "text_chars" in record:
+        body["text"] = "y" * max(int(record["text_chars"]), 1)
+    return body
+
+
+async def _stub_call_router(payload, timeout=None):
+    from server.traffic import note_upstream
+
+    delay_ms = _replay_upstream_ms.get()
+    await asyncio.sleep(delay_ms / 1000)
+    note_upstream(delay_ms)
+    return {
+        "choices": [{"message": {"content": "## Key Goals\n- Stubbed reply.\n\nWhat would you like to explore next?"}}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
+
+
+class _StubTextToSpeech:
+    async def stream(self, text, voice_id=None, **kwargs):
+        total = max(len(text) * STUB_AUDIO_BYTES_PER_CHAR, STUB_AUDIO_CHUNK)
+        chunks = -(-total // STUB_AUDIO_CHUNK)
+        pause = _replay_upstream_ms.get() / 1000 / chunks
+        for _ in range(chunks):
+            await asyncio.sleep(pause)
+            yield b"\xff" * STUB_AUDIO_CHUNK
+
+
+class _StubElevenLabs:
+    def __init__(self):
+        self.text_to_speech = _StubTextToSpeech()
+
+
+def install_stubs(main_module):
+    """Swap the router and ElevenLabs clients on server.main for latency-faithful stubs."""
+    main_module.call_router = _stub_call_router
+    main_module.elevenlabs_client = _StubElevenLabs()
+
+
+def stubbed_app():
+    """
+    ASGI app with stub providers installed, exposing the recorded upstream latency
+    header to the stubs. Usable in-process or as a uvicorn factory
+    (`uvicorn server.replay:stubbed_app --factory`).
+
+    The shared cache is turned off: synthetic bodies must reach the stubs on every
+    replay, and stub output must never end up in the real cache.
+    """
+    os.environ["KAI_CACHE_PATH"] = "off"
+    import server.main as main_module
+    from server.cache import cache
+
+    # Covers server.cache having been imported before this was called
+    cache.path = None
+
+    install_stubs(main_module)
+    inner = main_module.app
+
+    async def app(scope, receive, send):
+        if scope["type"] == "http":
+            for name, value in scope.get("headers", []):
+                if name == UPSTREAM_HEADER.encode():
+                    try:
+                        _replay_upstream_ms.set(float(value))
+                    except ValueError:
+                        pass
+                    break
+        await inner(scope, receive, send)
+
+    return app
+
+
+async def _issue(client, record, start_at, loop_start, results):
+    delay = start_at - (time.perf_counter() - loop_start)
+    if delay > 0:
+        await asyncio.sleep(delay)
+    endpoint = record.get("endpoint", "/api/conversation")
+    # Traces don't keep session ids; a fresh one per request stands in for the many
+    # real sessions, so one replaying client doesn't spend a single session budget
+    headers = {
+        UPSTREAM_HEADER: str(record.get("upstream_ms", 0) or 0),
+        SESSION_HEADER: f"replay-{uuid.uuid4().hex[:16]}",
+    }
+    started = time.perf_counter()
+    try:
+        resp = await client.request(record.get("method", "POST"), endpoint, json=synth_body(record), headers=headers)
+        await resp.aread()
+        status = resp.status_code
+    except Exception as e:
+        status = f"error:{type(e).__name__}"
+    results.append((endpoint, status, (time.perf_counter() - started) * 1000))
+
+
+async def replay(records, speed=1.0, base_url=None, app=None, timeout=120.0):
+    """
+    Re-issue `records` and return [(endpoint, status, latency_ms), ...].
+    With base_url, requests go to a running server (which should itself be started
+    from stubbed_app); otherwise they are dispatched in-process to `app`
+    (default: a fresh stubbed_app()).
+    """
+    if base_url:
+        client = httpx.AsyncClient(base_url=base_url, timeout=timeout)
+    else:
+        app = app or stubbed_app()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://replay", timeout=timeout)
+    results = []
+    t0 = records[0].get("ts", 0) if records else 0
+    loop_start = time.perf_counter()
+    async with client:
+        await asyncio.gather(*(
+            _issue(client, r, (r.get("ts", 0) - t0) / speed, loop_start, results)
+            for r in records
+        ))
+    return results
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+def summarize(results, wall_s=None):
+    """Per-endpoint latency distribution as a list of dict rows."""
+    rows = []
+    by_endpoint = {}
+    for endpoint, status, ms in results:
+        by_endpoint.setdefault(endpoint, []).append((status, ms))
+    for endpoint in sorted(by_endpoint):
+        entries = by_endpoint[endpoint]
+        lat = sorted(ms for _, ms in entries)
+        rows.append({
+            "endpoint": endpoint,
+            "count": len(entries),
+            "errors": sum(1 for s, _ in entries if not (isinstance(s, int) and s < 400)),
+            "mean_ms": round(statistics.fmean(lat), 1),
+            "p50_ms": round(_percentile(lat, 50), 1),
+            "p90_ms": round(_percentile(lat, 90), 1),
+            "p99_ms": round(_percentile(lat, 99), 1),
+            "max_ms": round(lat[-1], 1),
+        })
+    if wall_s:
+        for row in rows:
+            row["rps"] = round(row["count"] / wall_s, 2)
+    return rows
+
+
+def print_report(rows, wall_s):
+    print(f"{'endpoint':<22}{'n':>6}{'err':>5}{'mean':>9}{'p50':>9}{'p90':>9}{'p99':>9}{'max':>9}")
+    for r in rows:
+        print(f"{r['endpoint']:<22}{r['count']:>6}{r['errors']:>5}{r['mean_ms']:>9}{r['p50_ms']:>9}{r['p90_ms']:>9}{r['p99_ms']:>9}{r['max_ms']:>9}")
+    total = sum(r["count"] for r in rows)
+    print(f"{total} requests in {wall_s:.2f}s ({total / wall_s:.1f} req/s)" if wall_s else "")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a Kai traffic trace with stub providers.")
+    parser.add_argument("trace", help="JSONL file written with KAI_TRAFFIC_RECORD")
+    parser.add_argument("--speed", type=float, default=1.0, help="arrival-time compression factor (default 1x)")
+    parser.add_argument("--limit", type=int, default=None, help="replay only the first N records")
+    parser.add_argument("--url", default=None, help="target a running server instead of the in-process app")
+    parser.add_argument("--json", action="store_true", help="print the summary as JSON")
+    args = parser.parse_args(argv)
+
+    records = load_trace(args.trace, args.limit)
+    if not records:
+        parser.error("trace is empty")
+    # Build the app up front so import cost isn't counted as replay time
+    app = None if args.url else stubbed_app()
+    started = time.perf_counter()
+    results = asyncio.run(replay(records, speed=max(args.speed, 1e-6), base_url=args.url, app=app))
+    wall_s = time.perf_counter() - started
+    rows = summarize(results, wall_s)
+    if args.json:
+        print(json.dumps({"wall_s": round(wall_s, 3), "endpoints": rows}, indent=2))
+    else:
+        print_report(rows, wall_s)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Production entry point for the FastAPI backend.
+
+    python -m server.serve --workers 4
+
+Runs uvicorn with multiple worker processes, uvloop/httptools when installed,
+keep-alive tuned for a reverse proxy in front, and a bounded graceful-shutdown
+window. Workers share TTS/summary/PDF results through server/cache.py, so set
+KAI_CACHE_PATH to a local (non-network) path visible to all of them.
+Run from the repo root so the static directory resolves.
+"""
+import argparse
+import importlib.util
+import os
+
+
+def _default_workers():
+    env = os.getenv("WEB_CONCURRENCY")
+    if env:
+        return int(env)
+    # Requests mostly wait on upstream providers, so a worker per core is plenty
+    return max(os.cpu_count() or 1, 1)
+
+
+def _pick(preferred, fallback):
+    return preferred if importlib.util.find_spec(preferred) else fallback
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the Kai backend with production settings.")
+    parser.add_argument("--app", default="server.main:app", help="ASGI import string (default server.main:app)")
+    parser.add_argument("--factory", action="store_true", help="treat --app as an application factory")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=_default_workers())
+    parser.add_argument("--keep-alive", type=int, default=int(os.getenv("KAI_KEEP_ALIVE", "65")),
+                        help="idle keep-alive seconds; keep above the proxy's idle timeout")
+    parser.add_argument("--graceful-timeout", type=int, default=int(os.getenv("KAI_GRACEFUL_TIMEOUT", "30")),
+                        help="seconds to let in-flight requests finish on shutdown")
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--access-log", action="store_true", help="enable uvicorn access logging")
+    args = parser.parse_args(argv)
+
+    import uvicorn
+
+    uvicorn.run(
+        args.app,
+        factory=args.factory,
+        host=args.host,
+        port=args.port,
+        workers=max(args.workers, 1),
+        loop=_pick("uvloop", "asyncio"),
+        http=_pick("httptools", "h11"),
+        timeout_keep_alive=args.keep_alive,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        backlog=args.backlog,
+        proxy_headers=True,
+        forwarded_allow_ips=os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1"),
+        access_log=args.access_log,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Connection setup shared by the SQLite-backed stores (server/cache.py,
+server/storage.py, server/usage.py), so they agree on what turns a store off
+and on how its database is opened.
+
+Each database is one file shared by every worker, opened in WAL mode (readers
+don't wait on the writer) with synchronous=NORMAL and a 5 second busy timeout.
+sqlite3 connections can't be shared across threads, so each thread gets its own.
+"""
+import os
+import sqlite3
+import tempfile
+import threading
+
+# Values of a path setting that turn the store off
+OFF_VALUES = ("", "off", "none", "0")
+
+
+def resolve_path(path, env_var, filename):
+    """
+    Database path for a store: `path` if given, else the `env_var` setting, else
+    <tmp>/`filename`. Returns None when the value turns the store off.
+    """
+    if path is None:
+        path = os.getenv(env_var, os.path.join(tempfile.gettempdir(), filename))
+    return None if path.strip().lower() in OFF_VALUES else path
+
+
+class LocalConnections:
+    """One connection per thread to the database at `path`, created with `schema` on first use."""
+
+    def __init__(self, path, schema):
+        self.path = path
+        self.schema = schema
+        self._local = threading.local()
+
+    def get(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(self.schema)
+            self._local.conn = conn
+        return conn
@@ -0,0 +1,261 @@
+"""
+Static serving for the uuid-named artifacts under server/static.
+
+A drop-in replacement for Starlette's StaticFiles mount, tuned for files that
+never change once written:
+- uuid-named artifacts get `Cache-Control: public, max-age=<1 year>, immutable`;
+  any other file gets `no-cache` so it is always revalidated
+- strong ETags (size + mtime) with If-None-Match → 304
+- single-range `Range` requests (206/416) with If-Range, so audio can seek
+- stat results are cached for KAI_STATIC_STAT_TTL seconds (a file evicted by
+  server/storage.py disappears from here within that window)
+- files up to KAI_STATIC_MEMORY_MAX_KB are kept in an in-memory LRU bounded by
+  KAI_STATIC_MEMORY_MB and served without touching the disk
+- larger files go out zero-copy when the ASGI server offers the
+  `http.response.zerocopysend` (any range) or `http.response.pathsend` (whole
+  file) extension; otherwise they are read in large chunks in a worker thread
+
+Reads are reported to the artifact store for LRU eviction.
+"""
+import mimetypes
+import os
+import stat
+import time
+from collections import OrderedDict
+from email.utils import formatdate
+
+import anyio
+from starlette._utils import get_route_path
+from starlette.exceptions import HTTPException
+
+from server.storage import is_artifact
+
+IMMUTABLE_MAX_AGE = int(os.getenv("KAI_STATIC_MAX_AGE", "31536000"))
+STAT_TTL = float(os.getenv("KAI_STATIC_STAT_TTL", "10"))
+MEMORY_BUDGET = int(float(os.getenv("KAI_STATIC_MEMORY_MB", "16")) * 1024 * 1024)
+MEMORY_MAX_FILE = int(float(os.getenv("KAI_STATIC_MEMORY_MAX_KB", "256")) * 1024)
+READ_CHUNK = 256 * 1024
+# Bound on remembered stat results, so probing random paths can't grow it forever
+MAX_ENTRIES = 4096
+
+
+class _Entry:
+    __slots__ = ("path", "size", "mtime_ns", "etag", "last_modified", "headers", "body", "checked")
+
+    def __init__(self, path, st, content_type, cache_control):
+        self.path = path
+        self.size = st.st_size
+        self.mtime_ns = st.st_mtime_ns
+        self.etag = f'"{st.st_size:x}-{st.st_mtime_ns:x}"'
+        self.last_modified = formatdate(st.st_mtime, usegmt=True)
+        self.headers = [
+            (b"content-type", content_type.encode("latin-1")),
+            (b"etag", self.etag.encode("latin-1")),
+            (b"last-modified", self.last_modified.encode("latin-1")),
+            (b"cache-control", cache_control.encode("latin-1")),
+            (b"accept-ranges", b"bytes"),
+        ]
+        self.body = None
+        self.checked = time.monotonic()
+
+
+def _parse_range(value, size):
+    """
+    (start, end) inclusive for a single `bytes=` range, "unsatisfiable", or None
+    to ignore the header (malformed or multi-range: the full file is sent).
+    """
+    unit, _, spec = value.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if first == "":
+            length = int(last)
+            if length <= 0 or size == 0:
+                return "unsatisfiable"
+            return max(size - length, 0), size - 1
+        start = int(first)
+        end = int(last) if last else None
+    except ValueError:
+        return None
+    if start < 0 or (end is not None and end < start):
+        return None
+    if start >= size:
+        return "unsatisfiable"
+    return start, size - 1 if end is None else min(end, size - 1)
+
+
+def _etag_matches(header, etag):
+    # If-None-Match uses weak comparison
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+class ImmutableStaticFiles:
+    def __init__(self, directory, store=None, memory_budget=None, memory_max_file=None, stat_ttl=None):
+        self.directory = os.path.realpath(directory)
+        if not os.path.isdir(self.directory):
+            raise RuntimeError(f"Directory '{directory}' does not exist")
+        self.store = store
+        self.memory_budget = MEMORY_BUDGET if memory_budget is None else memory_budget
+        self.memory_max_file = MEMORY_MAX_FILE if memory_max_file is None else memory_max_file
+        self.stat_ttl = STAT_TTL if stat_ttl is None else stat_ttl
+        self._entries = OrderedDict()
+        self._hot = OrderedDict()
+        self._hot_bytes = 0
+
+    # --- Lookup (stat cache + hot-file cache) ---
+
+    def _load(self, rel, previous):
+        """Blocking: stat `rel` and, for small files, read it. Runs in a worker thread."""
+        full = os.path.realpath(os.path.join(self.directory, rel))
+        try:
+            if os.path.commonpath([full, self.directory]) != self.directory:
+                return None
+        except ValueError:  # different drive on Windows
+            return None
+        try:
+            st = os.stat(full)
+        except (FileNotFoundError, NotADirectoryError, PermissionError, OSError):
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        if previous is not None and previous.size == st.st_size and previous.mtime_ns == st.st_mtime_ns:
+            previous.checked = time.monotonic()
+            return previous
+        name = os.path.basename(full)
+        content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        if content_type.startswith("text/"):
+            content_type += "; charset=utf-8"
+        cache_control = (
+            f"public, max-age={IMMUTABLE_MAX_AGE}, immutable" if is_artifact(name) else "no-cache"
+        )
+        entry = _Entry(full, st, content_type, cache_control)
+        if entry.size <= self.memory_max_file:
+            try:
+                with open(full, "rb") as f:
+                    entry.body = f.read()
+            except OSError:
+                return None
+            if len(entry.body) != entry.size:
+                # Changed between stat and read; serve it from disk this time
+                entry.body = None
+        return entry
+
+    def _remember(self, rel, entry):
+        self._forget(rel)
+        self._entries[rel] = entry
+        if len(self._entries) > MAX_ENTRIES:
+            self._forget(next(iter(self._entries)))
+        if entry.body is not None:
+            self._hot[rel] = entry
+            self._hot_bytes += entry.size
+            while self._hot_bytes > self.memory_budget and self._hot:
+                _, cold = self._hot.popitem(last=False)
+                self._hot_bytes -= cold.size
+                cold.body = None
+
+    def _forget(self, rel):
+        entry = self._entries.pop(rel, None)
+        if entry is not None and self._hot.pop(rel, None) is not None:
+            self._hot_bytes -= entry.size
+            entry.body = None
+
+    async def _lookup(self, rel):
+        entry = self._entries.get(rel)
+        if entry is not None and time.monotonic() - entry.checked < self.stat_ttl:
+            self._entries.move_to_end(rel)
+            if rel in self._hot:
+                self._hot.move_to_end(rel)
+            return entry
+        fresh = await anyio.to_thread.run_sync(self._load, rel, entry)
+        if fresh is None:
+            self._forget(rel)
+        elif fresh is not entry:
+            self._remember(rel, fresh)
+        return fresh
+
+    # --- ASGI ---
+
+    async def __call__(self, scope, receive, send):
+        assert scope["type"] == "http"
+        if scope["method"] not in ("GET", "HEAD"):
+            raise HTTPException(status_code=405, headers={"Allow": "GET, HEAD"})
+        rel = os.path.normpath(get_route_path(scope).lstrip("/"))
+        if rel in ("", ".") or "\x00" in rel:
+            raise HTTPException(status_code=404)
+        entry = await self._lookup(rel)
+        if entry is None:
+            raise HTTPException(status_code=404)
+
+        request_headers = {}
+        for name, value in scope["headers"]:
+            if name in (b"if-none-match", b"range", b"if-range"):
+                request_headers[name] = value.decode("latin-1")
+
+        if self.store is not None:
+            self.store.touch(rel.replace(os.sep, "/"))
+
+        if_none_match = request_headers.get(b"if-none-match")
+        if if_none_match is not None and _etag_matches(if_none_match, entry.etag):
+            await send({"type": "http.response.start", "status": 304, "headers": entry.headers[1:4]})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        start, end, status = 0, entry.size - 1, 200
+        headers = list(entry.headers)
+        range_header = request_headers.get(b"range")
+        if_range = request_headers.get(b"if-range")
+        if range_header is not None and (if_range is None or if_range.strip() in (entry.etag, entry.last_modified)):
+            parsed = _parse_range(range_header, entry.size)
+            if parsed == "unsatisfiable":
+                headers.append((b"content-range", f"bytes */{entry.size}".encode("latin-1")))
+                headers.append((b"content-length", b"0"))
+                await send({"type": "http.response.start", "status": 416, "headers": headers})
+                await send({"type": "http.response.body", "body": b""})
+                return
+            if parsed is not None:
+                start, end = parsed
+                status = 206
+                headers.append((b"content-range", f"bytes {start}-{end}/{entry.size}".encode("latin-1")))
+        length = end - start + 1 if entry.size else 0
+        headers.append((b"content-length", str(length).encode("latin-1")))
+
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        if scope["method"] == "HEAD" or length == 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+        body = entry.body
+        if body is not None:
+            await send({"type": "http.response.body", "body": body if status == 200 else body[start:end + 1]})
+            return
+        await self._send_file(scope, send, entry, start, length, status)
+
+    async def _send_file(self, scope, send, entry, start, length, status):
+        extensions = scope.get("extensions") or {}
+        if status == 200 and "http.response.pathsend" in extensions:
+            await send({"type": "http.response.pathsend", "path": entry.path})
+            return
+        try:
+            f = open(entry.path, "rb")
+        except OSError:
+            # Evicted after the headers went out; end the body short
+            await send({"type": "http.response.body", "body": b""})
+            return
+        with f:
+            if "http.response.zerocopysend" in extensions:
+                await send({"type": "http.response.zerocopysend", "file": f, "offset": start, "count": length})
+                return
+            f.seek(start)
+            left = length
+            while left > 0:
+                data = await anyio.to_thread.run_sync(f.read, min(READ_CHUNK, left))
+                if not data:
+                    # Truncated underneath us; end the body short
+                    await send({"type": "http.response.body", "body": b""})
+                    return
+                left -= len(data)
+                await send({"type": "http.response.body", "body": data, "more_body": left > 0})
@@ -0,0 +1,289 @@
+"""
+Lifecycle management for the uuid-named artifacts under server/static (audio
+clips in audio/, PDFs in docs/).
+
+Every artifact is tracked in a small SQLite index (path, size, last access). A
+background sweeper started from the app lifespan deletes artifacts not accessed
+within the TTL, then the least-recently-accessed ones until the directories fit
+the byte budget. On startup the index is reconciled with the disk: files it
+doesn't know about (e.g. orphans left by earlier versions) are adopted with
+their mtime as last access, and rows whose file is gone are dropped. Only
+uuid-named files are ever indexed or deleted. Reads only note the access in
+memory; the sweeper writes them to the index every TOUCH_INTERVAL seconds and
+before each sweep.
+
+Configuration (environment):
+- KAI_STORAGE_INDEX: index database (default: <tmp>/kai-storage.sqlite3; "off" disables)
+- KAI_STORAGE_MAX_MB: byte budget across the managed directories (default 100)
+- KAI_STORAGE_TTL: seconds since last access before eviction (default 604800, 7 days)
+- KAI_STORAGE_SWEEP_INTERVAL: seconds between sweeps (default 300)
+
+Index failures are logged and never surface to requests.
+"""
+import asyncio
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+
+from server.sqlite_store import LocalConnections, resolve_path
+
+logger = logging.getLogger("kai.storage")
+
+STATIC_DIR = "server/static"
+MANAGED_DIRS = ("audio", "docs")
+
+_ARTIFACT_NAME = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\.[A-Za-z0-9]+")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifacts (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS artifacts_accessed ON artifacts (accessed);
+"""
+
+# Access times are recorded at most this often per file and written to the index
+# in one batch this often, so serving a file never waits on SQLite
+TOUCH_INTERVAL = 60
+
+
+def is_artifact(name):
+    return _ARTIFACT_NAME.fullmatch(name) is not None
+
+
+class ArtifactStore:
+    def __init__(self, root=STATIC_DIR, dirs=MANAGED_DIRS, index_path=None, max_bytes=None, ttl=None, sweep_interval=None):
+        self.index_path = resolve_path(index_path, "KAI_STORAGE_INDEX", "kai-storage.sqlite3")
+        self.root = root
+        self.dirs = tuple(dirs)
+        self.max_bytes = max_bytes or int(float(os.getenv("KAI_STORAGE_MAX_MB", "100")) * 1024 * 1024)
+        self.ttl = ttl or float(os.getenv("KAI_STORAGE_TTL", "604800"))
+        self.sweep_interval = sweep_interval or float(os.getenv("KAI_STORAGE_SWEEP_INTERVAL", "300"))
+        self._conns = LocalConnections(self.index_path, _SCHEMA)
+        self._touched = {}
+        self._pending_touches = {}  # path -> last access not yet in the index
+        self._counter_lock = threading.Lock()
+        self.evictions = {"ttl": 0, "budget": 0}
+        self.evicted_bytes = 0
+        self.delete_errors = 0
+        self.adopted = 0
+        self.last_sweep = None
+        self.last_sweep_ms = None
+
+    @property
+    def enabled(self):
+        return self.index_path is not None
+
+    def _conn(self):
+        return self._conns.get()
+
+    def _full_path(self, rel):
+        return os.path.join(self.root, *rel.split("/"))
+
+    # --- Writers and readers ---
+
+    def save(self, kind, data, suffix):
+        """
+        Write `data` as a new uuid-named artifact under `kind` (e.g. "audio", ".mp3")
+        and index it. Returns the path relative to the static root, e.g.
+        "audio/<uuid>.mp3", which is served at /static/<path>.
+        """
+        if kind not in self.dirs:
+            raise ValueError(f"unmanaged artifact directory: {kind}")
+        rel = f"{kind}/{uuid.uuid4()}{suffix}"
+        full = self._full_path(rel)
+        os.makedirs(os.path.dirname(full), exist_ok=True)
+        tmp = f"{full}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, full)
+        if self.enabled:
+            now = time.time()
+            try:
+                self._conn().execute(
+                    "INSERT OR REPLACE INTO artifacts (path, size, created, accessed) VALUES (?, ?, ?, ?)",
+                    (rel, len(data), now, now),
+                )
+                self._touched[rel] = now
+            except sqlite3.Error as e:
+                logger.warning("Storage index write failed for %s: %s", rel, e)
+        return rel
+
+    def touch(self, rel):
+        """Record an access to `rel` (relative to the static root) for LRU/TTL eviction."""
+        if not self.enabled:
+            return
+        now = time.time()
+        if now - self._touched.get(rel, 0) < TOUCH_INTERVAL:
+            return
+        self._touched[rel] = now
+        with self._counter_lock:
+            self._pending_touches[rel] = now
+
+    # --- Maintenance (blocking; the sweeper runs these in a worker thread) ---
+
+    def flush_touches(self):
+        """Write the access times recorded by touch() to the index."""
+        if not self.enabled:
+            return
+        with self._counter_lock:
+            pending, self._pending_touches = self._pending_touches, {}
+        if not pending:
+            return
+        try:
+            self._conn().executemany(
+                "UPDATE artifacts SET accessed = MAX(accessed, ?) WHERE path = ?",
+                [(when, path) for path, when in pending.items()],
+            )
+        except sqlite3.Error as e:
+            logger.warning("Storage index touch failed for %d file(s): %s", len(pending), e)
+
+    def reconcile(self):
+        """Adopt artifacts on disk the index doesn't know and forget rows whose file is gone."""
+        if not self.enabled:
+            return
+        on_disk = {}
+        for kind in self.dirs:
+            try:
+                entries = list(os.scandir(os.path.join(self.root, kind)))
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                if entry.is_file() and is_artifact(entry.name):
+                    st = entry.stat()
+                    on_disk[f"{kind}/{entry.name}"] = (st.st_size, st.st_mtime)
+        try:
+            conn = self._conn()
+            indexed = {path for (path,) in conn.execute("SELECT path FROM artifacts")}
+            adopted = [(p, size, mtime, mtime) for p, (size, mtime) in on_disk.items() if p not in indexed]
+            missing = [(p,) for p in indexed if p not in on_disk]
+            conn.executemany("INSERT OR IGNORE INTO artifacts (path, size, created, accessed) VALUES (?, ?, ?, ?)", adopted)
+            conn.executemany("DELETE FROM artifacts WHERE path = ?", missing)
+        except sqlite3.Error as e:
+            logger.warning("Storage reconcile failed: %s", e)
+            return
+        with self._counter_lock:
+            self.adopted += len(adopted)
+        if adopted or missing:
+            logger.info(
+                "Storage reconciled: adopted %d unindexed file(s) (%d bytes), dropped %d stale row(s)",
+                len(adopted), sum(a[1] for a in adopted), len(missing),
+            )
+
+    def _evict(self, conn, victims, reason):
+        removed = []
+        freed = 0
+        for path, size in victims:
+            try:
+                os.remove(self._full_path(path))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                # e.g. a read-only deployment filesystem; keep the row and try again next sweep
+                with self._counter_lock:
+                    self.delete_errors += 1
+                logger.warning("Could not evict %s: %s", path, e)
+                continue
+            removed.append((path,))
+            self._touched.pop(path, None)
+            freed += size
+        conn.executemany("DELETE FROM artifacts WHERE path = ?", removed)
+        with self._counter_lock:
+            self.evictions[reason] += len(removed)
+            self.evicted_bytes += freed
+        return len(removed), freed
+
+    def sweep(self):
+        """Evict artifacts past the TTL, then least-recently-accessed ones until under budget."""
+        if not self.enabled:
+            return
+        started = time.perf_counter()
+        # Files read since the last flush must not look idle
+        self.flush_touches()
+        try:
+            conn = self._conn()
+            expired = conn.execute(
+                "SELECT path, size FROM artifacts WHERE accessed < ?", (time.time() - self.ttl,)
+            ).fetchall()
+            ttl_count, ttl_bytes = self._evict(conn, expired, "ttl")
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM artifacts").fetchone()[0]
+            budget_count = budget_bytes = 0
+            if total > self.max_bytes:
+                excess = total - self.max_bytes
+                victims = []
+                freed = 0
+                for path, size in conn.execute("SELECT path, size FROM artifacts ORDER BY accessed"):
+                    victims.append((path, size))
+                    freed += size
+                    if freed >= excess:
+                        break
+                budget_count, budget_bytes = self._evict(conn, victims, "budget")
+        except sqlite3.Error as e:
+            logger.warning("Storage sweep failed: %s", e)
+            return
+        self.last_sweep = time.time()
+        self.last_sweep_ms = (time.perf_counter() - started) * 1000
+        if ttl_count or budget_count:
+            logger.info(
+                "Storage sweep evicted %d expired (%d bytes) and %d over-budget (%d bytes) artifact(s)",
+                ttl_count, ttl_bytes, budget_count, budget_bytes,
+            )
+
+    async def run_sweeper(self):
+        """
+        Reconcile once, then sweep every `sweep_interval` seconds and write pending
+        access times every TOUCH_INTERVAL seconds until cancelled.
+        """
+        if not self.enabled:
+            return
+        await asyncio.to_thread(self.reconcile)
+        next_sweep = 0.0
+        while True:
+            try:
+                if time.monotonic() >= next_sweep:
+                    next_sweep = time.monotonic() + self.sweep_interval
+                    await asyncio.to_thread(self.sweep)
+                else:
+                    await asyncio.to_thread(self.flush_touches)
+            except Exception:
+                logger.exception("Storage sweep crashed")
+            await asyncio.sleep(min(TOUCH_INTERVAL, max(next_sweep - time.monotonic(), 0)))
+
+    # --- Metrics ---
+
+    def stats(self):
+        """Bytes and files in use per directory (shared index) plus this worker's eviction counters."""
+        usage = {kind: {"bytes": 0, "files": 0} for kind in self.dirs}
+        if self.enabled:
+            try:
+                rows = self._conn().execute(
+                    "SELECT substr(path, 1, instr(path, '/') - 1) AS kind, SUM(size), COUNT(*) FROM artifacts GROUP BY kind"
+                ).fetchall()
+                for kind, size, count in rows:
+                    if kind in usage:
+                        usage[kind] = {"bytes": size, "files": count}
+            except sqlite3.Error as e:
+                logger.warning("Storage stats failed: %s", e)
+        with self._counter_lock:
+            return {
+                "enabled": self.enabled,
+                "bytes_used": sum(u["bytes"] for u in usage.values()),
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "dirs": usage,
+                "evictions": dict(self.evictions),
+                "evicted_bytes": self.evicted_bytes,
+                "delete_errors": self.delete_errors,
+                "adopted": self.adopted,
+                "last_sweep": self.last_sweep,
+                "last_sweep_ms": self.last_sweep_ms,
+            }
+
+
+store = ArtifactStore()
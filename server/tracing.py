@@ -0,0 +1,281 @@
+"""
+Request IDs, lightweight spans and non-blocking export for the backend.
+
+Every HTTP request gets an id (the client's X-Request-ID if sane, otherwise a new
+one) that is echoed in the response header, forwarded to upstream providers and
+stamped on every log line. Spans follow the OpenTelemetry data model (trace id,
+span id, parent, start/end, attributes, status) without depending on the SDK.
+
+Finished spans are handed to a background thread through a queue, so the hot
+path only pays for an enqueue. Sinks (environment):
+- KAI_TRACE_FILE: append spans as JSON lines
+- KAI_OTLP_ENDPOINT: POST batches as OTLP/HTTP JSON (e.g. http://localhost:4318/v1/traces)
+With neither set, request ids and log stamping still work and spans are dropped.
+"""
+import atexit
+import hashlib
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from server.batching import BatchWriter
+
+REQUEST_ID_HEADER = "X-Request-ID"
+SERVICE_NAME = os.getenv("KAI_SERVICE_NAME", "kai-backend")
+
+_request_id: ContextVar[str] = ContextVar("kai_request_id", default="-")
+_current_span: ContextVar[Optional["Span"]] = ContextVar("kai_current_span", default=None)
+
+# Client-supplied ids are only trusted when short and header/log safe
+_VALID_REQUEST_ID = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+
+
+def current_request_id():
+    return _request_id.get()
+
+
+def current_span():
+    return _current_span.get()
+
+
+def _trace_id_for(request_id):
+    if re.fullmatch(r"[0-9a-f]{32}", request_id):
+        return request_id
+    return hashlib.sha256(request_id.encode()).hexdigest()[:32]
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "request_id", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.request_id = parent.request_id if parent else current_request_id()
+        self.trace_id = parent.trace_id if parent else _trace_id_for(self.request_id)
+        self.parent_id = parent.span_id if parent else None
+        self.span_id = os.urandom(8).hex()
+        self.attributes = dict(attributes or {})
+        self.error = None
+        self.end_ns = None
+        self.start_ns = time.time_ns()
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def end(self, error=None):
+        """Finish the span (idempotent) and hand it to the exporter."""
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        exporter.submit(self)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_span_id": self.parent_id,
+            "request_id": self.request_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "attributes": self.attributes,
+            "status": "error" if self.error else "ok",
+            "error": self.error,
+        }
+
+
+def start_span(name, parent=None, **attributes):
+    """
+    Start a span without making it current; the caller must call .end().
+    Use for work that outlives a `with` block, such as a streamed response body.
+    """
+    return Span(name, parent or current_span(), attributes)
+
+
+@contextmanager
+def span(name, **attributes):
+    """Run a block inside a child span of the current one."""
+    s = Span(name, current_span(), attributes)
+    token = _current_span.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.end(error=e)
+        raise
+    finally:
+        _current_span.reset(token)
+        s.end()
+
+
+# --- Export ---
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_payload(spans):
+    otlp_spans = []
+    for s in spans:
+        attrs = dict(s["attributes"], **{"kai.request_id": s["request_id"]})
+        item = {
+            "traceId": s["trace_id"],
+            "spanId": s["span_id"],
+            "name": s["name"],
+            "kind": 2 if s["parent_span_id"] is None else 1,
+            "startTimeUnixNano": str(s["start_ns"]),
+            "endTimeUnixNano": str(s["end_ns"]),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in attrs.items() if v is not None],
+            "status": {"code": 2, "message": s["error"]} if s["error"] else {"code": 1},
+        }
+        if s["parent_span_id"]:
+            item["parentSpanId"] = s["parent_span_id"]
+        otlp_spans.append(item)
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": "kai"}, "spans": otlp_spans}],
+        }]
+    }
+
+
+class SpanExporter:
+    """Batches finished spans to the sinks off the request path (server/batching.py)."""
+
+    def __init__(self, path=None, otlp_endpoint=None, max_queue=10000, batch_size=256, flush_interval=1.0):
+        self.path = path if path is not None else os.getenv("KAI_TRACE_FILE")
+        self.otlp_endpoint = otlp_endpoint if otlp_endpoint is not None else os.getenv("KAI_OTLP_ENDPOINT")
+        self._writer = BatchWriter(self._export, "kai-span-exporter", max_queue, batch_size, flush_interval)
+
+    @property
+    def enabled(self):
+        return bool(self.path or self.otlp_endpoint)
+
+    @property
+    def dropped(self):
+        return self._writer.dropped
+
+    def submit(self, s):
+        if self.enabled:
+            self._writer.submit(s)
+
+    def flush(self):
+        """Export whatever is queued or in flight."""
+        self._writer.flush()
+
+    def _export(self, batch):
+        records = [s.to_dict() for s in batch]
+        if self.path:
+            try:
+                with open(self.path, "a", encoding="utf-8") as fh:
+                    fh.write("".join(json.dumps(r, separators=(",", ":")) + "\n" for r in records))
+            except OSError as e:
+                logger.warning("Span file export failed: %s", e)
+        if self.otlp_endpoint:
+            import requests
+
+            try:
+                requests.post(self.otlp_endpoint, json=_otlp_payload(records), timeout=5)
+            except requests.RequestException as e:
+                logger.warning("OTLP export failed: %s", e)
+
+
+exporter = SpanExporter()
+
+
+# --- Logging ---
+class _RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = current_request_id()
+        return True
+
+
+def configure_logging(level=None):
+    """
+    Route the "kai" logger through a QueueHandler so log I/O happens on a listener
+    thread, and stamp each record with the current request id.
+    """
+    root = logging.getLogger("kai")
+    if getattr(root, "_kai_configured", False):
+        return
+    log_queue = queue.SimpleQueue()
+    handler = logging.handlers.QueueHandler(log_queue)
+    handler.addFilter(_RequestIdFilter())
+    stream = logging.StreamHandler()
+    stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s"))
+    listener = logging.handlers.QueueListener(log_queue, stream)
+    listener.start()
+    atexit.register(listener.stop)
+    root.addHandler(handler)
+    root.setLevel(level or os.getenv("KAI_LOG_LEVEL", "INFO"))
+    root.propagate = False
+    root._kai_configured = True
+
+
+logger = logging.getLogger("kai.tracing")
+
+
+# --- Middleware ---
+class RequestContextMiddleware:
+    """
+    Assigns the request id, opens the root span for the request and echoes the id
+    in the response headers. Pure ASGI so streamed bodies are covered by the span.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope.get("headers", []):
+            if name == b"x-request-id":
+                candidate = value.decode("latin-1")
+                if _VALID_REQUEST_ID.match(candidate):
+                    request_id = candidate
+                break
+        request_id = request_id or uuid.uuid4().hex
+        rid_token = _request_id.set(request_id)
+
+        root = Span(f"{scope['method']} {scope['path']}", None, {
+            "http.method": scope["method"],
+            "http.target": scope["path"],
+        })
+        span_token = _current_span.set(root)
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                root.set("http.status_code", message["status"])
+                if message["status"] >= 500:
+                    root.error = f"HTTP {message['status']}"
+                headers = list(message.get("headers", []))
+                headers.append((b"x-request-id", request_id.encode("latin-1")))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        except BaseException as e:
+            root.end(error=e)
+            raise
+        finally:
+            _current_span.reset(span_token)
+            _request_id.reset(rid_token)
+            root.end()
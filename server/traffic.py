@@ -0,0 +1,143 @@
+"""
+Opt-in traffic recording for the FastAPI backend.
+
+Set KAI_TRAFFIC_RECORD=/path/to/trace.jsonl and every /api/* request appends one
+JSON line describing its *shape* (endpoint, history length, text sizes, status,
+timing, upstream latency). Message text is never written. Lines are written by
+a background thread, so recording never blocks the event loop; if the disk
+falls behind, records are dropped rather than queued without bound. Replay a
+trace with `python -m server.replay trace.jsonl`.
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from server.batching import BatchWriter
+
+logger = logging.getLogger("kai.traffic")
+
+# Per-request bucket of upstream call durations (ms). The middleware installs a
+# fresh list; provider call sites append to it via note_upstream().
+_upstream_ms: ContextVar[Optional[list]] = ContextVar("kai_upstream_ms", default=None)
+
+
+def note_upstream(elapsed_ms):
+    """Record time spent waiting on an upstream provider for the current request."""
+    bucket = _upstream_ms.get()
+    if bucket is not None:
+        bucket.append(elapsed_ms)
+
+
+def describe_body(body):
+    """
+    Reduce a JSON request body to sizes only:
+    - history_len / history_chars: number of history rows and their total text length
+    - text_chars: length of the top-level 'text' field
+    Unparseable bodies yield an empty description.
+    """
+    try:
+        data = json.loads(body.decode("utf-8") or "{}")
+    except Exception:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    shape = {}
+    history = data.get("history")
+    if isinstance(history, list):
+        shape["history_len"] = len(history)
+        shape["history_chars"] = sum(
+            len(str(m.get("text", ""))) for m in history if isinstance(m, dict)
+        )
+    if isinstance(data.get("text"), str):
+        shape["text_chars"] = len(data["text"])
+    return shape
+
+
+class TrafficRecorder:
+    """
+    Pure ASGI middleware (no BaseHTTPMiddleware) so streaming responses such as
+    /api/tts pass through untouched; duration covers the full body being sent.
+    """
+
+    def __init__(self, app, path=None, max_queue=10000, batch_size=256):
+        self.app = app
+        self.path = path or os.getenv("KAI_TRAFFIC_RECORD")
+        self._writer = BatchWriter(self._write, "kai-traffic-writer", max_queue, batch_size)
+
+    @property
+    def dropped(self):
+        return self._writer.dropped
+
+    async def __call__(self, scope, receive, send):
+        if (
+            not self.path
+            or scope["type"] != "http"
+            or not scope["path"].startswith("/api/")
+            or scope["path"].startswith("/api/static/")
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        body = []
+        result = {"status": 500, "started": False, "disconnected": False, "response_bytes": 0}
+
+        async def recording_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                body.append(message.get("body", b""))
+            elif message["type"] == "http.disconnect":
+                result["disconnected"] = True
+            return message
+
+        async def recording_send(message):
+            if message["type"] == "http.response.start":
+                result["status"] = message["status"]
+                result["started"] = True
+            elif message["type"] == "http.response.body":
+                result["response_bytes"] += len(message.get("body", b""))
+            await send(message)
+
+        upstream = []
+        token = _upstream_ms.set(upstream)
+        wall = time.time()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, recording_receive, recording_send)
+            # DisconnectMiddleware (inside) ends quietly when the client goes away first
+            if result["disconnected"] and not result["started"]:
+                result["status"] = 499
+        except asyncio.CancelledError:
+            # Client went away before the response was sent (nginx's "client closed request")
+            if not result["started"]:
+                result["status"] = 499
+            raise
+        finally:
+            _upstream_ms.reset(token)
+            record = {
+                "ts": round(wall, 3),
+                "method": scope["method"],
+                "endpoint": scope["path"],
+                "status": result["status"],
+                "duration_ms": round((time.perf_counter() - started) * 1000, 1),
+                "upstream_ms": round(sum(upstream), 1),
+                "upstream_calls": len(upstream),
+                "response_bytes": result["response_bytes"],
+            }
+            record.update(describe_body(b"".join(body)))
+            self._writer.submit(record)
+
+    def flush(self):
+        """Write whatever is queued or in flight."""
+        self._writer.flush()
+
+    def _write(self, records):
+        lines = "".join(json.dumps(r, separators=(",", ":")) + "\n" for r in records)
+        try:
+            with open(self.path, "a", encoding="utf-8") as fh:
+                fh.write(lines)
+        except OSError as e:
+            logger.warning("Traffic recorder write failed (%d records): %s", len(records), e)
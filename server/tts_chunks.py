@@ -0,0 +1,191 @@
+"""
+Parallel chunked synthesis for long TTS texts (e.g. a spoken session summary).
+
+The text is split at paragraph, then sentence boundaries into chunks of at most
+KAI_TTS_CHUNK_CHARS characters (the first one smaller so audio starts sooner).
+All chunks are scheduled at once but at most KAI_TTS_CONCURRENCY synthesize at a
+time, earliest first. Each chunk is retried on transient errors and cached on
+its own, so a re-read summary or a shared sentence costs nothing. Chunks are
+yielded strictly in text order as soon as every preceding chunk is complete;
+MP3 frames concatenate cleanly, so the client sees one continuous stream.
+
+Chunks that start before the first one is ready are bounded by the request
+deadline, like any call made before the response starts. Once audio is flowing
+the deadline no longer applies, and each later chunk gets a fixed
+KAI_TTS_CHUNK_TIMEOUT instead.
+"""
+import asyncio
+import logging
+import os
+import re
+import time
+
+import httpx
+from elevenlabs.core.api_error import ApiError
+
+from server.cache import cache, make_key
+from server.tracing import start_span
+from server.usage import ledger
+
+logger = logging.getLogger("kai.tts")
+
+CHUNK_CHARS = int(os.getenv("KAI_TTS_CHUNK_CHARS", "400"))
+FIRST_CHUNK_CHARS = int(os.getenv("KAI_TTS_FIRST_CHUNK_CHARS", "200"))
+CONCURRENCY = int(os.getenv("KAI_TTS_CONCURRENCY", "3"))
+RETRIES = int(os.getenv("KAI_TTS_RETRIES", "2"))
+# Per-call timeout (seconds) for chunks started after the first one is ready
+CHUNK_TIMEOUT = float(os.getenv("KAI_TTS_CHUNK_TIMEOUT", "30"))
+# Texts longer than this are chunked automatically when the client doesn't choose
+AUTO_THRESHOLD = int(os.getenv("KAI_TTS_CHUNK_THRESHOLD", "600"))
+
+# Provider answers that won't change on retry: bad request, auth, validation, quota/rate limit
+_PERMANENT_STATUS = frozenset((400, 401, 403, 422, 429))
+
+_SENTENCE_END = re.compile(r"(?<=[.!?…])[\"'”’)\]]*\s+")
+
+
+def _pieces(text, limit):
+    """Sentences of a paragraph, with over-long sentences split at word boundaries."""
+    for sentence in _SENTENCE_END.split(text):
+        sentence = sentence.strip()
+        while len(sentence) > limit:
+            cut = sentence.rfind(" ", 0, limit)
+            cut = cut if cut > 0 else limit
+            yield sentence[:cut].strip()
+            sentence = sentence[cut:].strip()
+        if sentence:
+            yield sentence
+
+
+def split_text(text, max_chars=None, first_chars=None):
+    """
+    Split `text` into synthesis chunks by packing whole sentences up to the size
+    limit. Paragraph ends are preferred break points: a chunk that is at least half
+    full is closed there, while short paragraphs (headings, one-liners) are packed
+    together rather than becoming tiny requests.
+    """
+    max_chars = max_chars or CHUNK_CHARS
+    first_chars = min(first_chars or FIRST_CHUNK_CHARS, max_chars)
+    chunks = []
+    current = ""
+    for paragraph in re.split(r"\n\s*\n", text):
+        limit = first_chars if not chunks else max_chars
+        if current and len(current) >= limit // 2:
+            chunks.append(current)
+            current = ""
+        separator = "\n" if current else ""
+        for sentence in _pieces(paragraph.replace("\n", " "), max_chars):
+            # Until the first chunk is out, pieces are held to its smaller limit
+            pieces = _pieces(sentence, first_chars) if not chunks and len(sentence) > first_chars else (sentence,)
+            for piece in pieces:
+                limit = first_chars if not chunks else max_chars
+                if current and len(current) + 1 + len(piece) > limit:
+                    chunks.append(current)
+                    current = piece
+                else:
+                    current = f"{current}{separator or ' '}{piece}" if current else piece
+                separator = ""
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def is_retryable(err):
+    """Timeouts, connection failures and provider 5xx are worth another try; client errors are not."""
+    if isinstance(err, ApiError):
+        return err.status_code not in _PERMANENT_STATUS
+    return isinstance(err, httpx.TransportError)
+
+
+async def synthesize_chunk(client, voice_id, text, index, request_options, parent_span=None, retries=None):
+    """Synthesize one chunk to bytes, from cache when possible, retrying transient errors."""
+    retries = RETRIES if retries is None else retries
+    key = make_key(voice_id, text)
+    s = start_span("tts.chunk", parent=parent_span, index=index, chars=len(text))
+    cached = await cache.aget("tts", key)
+    if cached is not None:
+        s.set("cache_hit", True)
+        s.end()
+        return cached
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            parts = []
+            async for part in client.text_to_speech.stream(text=text, voice_id=voice_id, request_options=request_options()):
+                parts.append(part)
+            audio = b"".join(parts)
+            break
+        except asyncio.CancelledError as e:
+            s.end(error=e)
+            raise
+        except Exception as e:
+            if attempt > retries or not is_retryable(e):
+                s.set("attempts", attempt)
+                s.end(error=e)
+                raise
+            logger.warning("TTS chunk %d failed (attempt %d), retrying: %s", index, attempt, e)
+            await asyncio.sleep(0.25 * 2 ** (attempt - 1))
+    ledger.record_tts_chars(len(text), span=s)
+    cache.set("tts", key, audio)
+    s.set("attempts", attempt)
+    s.set("bytes", len(audio))
+    s.end()
+    return audio
+
+
+class ChunkedSynthesis:
+    """
+    Schedules every chunk up front behind a semaphore; `await first()` surfaces
+    errors from the opening chunk before any response is sent, `stream()` yields
+    audio in order and cancels outstanding work if the consumer goes away.
+
+    `request_options(timeout)` builds each provider call's options: with
+    timeout=None it is bounded by the request deadline, which only holds until
+    first() has returned; later calls get CHUNK_TIMEOUT.
+    """
+
+    def __init__(self, client, voice_id, chunks, request_options, parent_span=None, concurrency=None):
+        self.chunks = chunks
+        self.waited = 0.0
+        self.streaming = False
+        semaphore = asyncio.Semaphore(max(concurrency or CONCURRENCY, 1))
+
+        def options():
+            return request_options(CHUNK_TIMEOUT if self.streaming else None)
+
+        async def run(index, text):
+            async with semaphore:
+                return await synthesize_chunk(client, voice_id, text, index, options, parent_span)
+
+        self.tasks = [asyncio.ensure_future(run(i, text)) for i, text in enumerate(chunks)]
+
+    async def _wait(self, task):
+        started = time.perf_counter()
+        try:
+            return await task
+        finally:
+            self.waited += time.perf_counter() - started
+
+    async def first(self):
+        try:
+            audio = await self._wait(self.tasks[0])
+        except BaseException:
+            self.cancel()
+            raise
+        self.streaming = True
+        return audio
+
+    async def stream(self):
+        try:
+            for task in self.tasks:
+                yield await self._wait(task)
+        finally:
+            self.cancel()
+
+    def cancel(self):
+        for task in self.tasks:
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled():
+                task.exception()  # mark retrieved so failures after a disconnect aren't logged as unhandled
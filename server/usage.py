@@ -0,0 +1,296 @@
+"""
+Token and TTS character accounting, per request and per session, with
+per-session budgets.
+
+Router responses report `usage` (prompt/completion/total tokens); TTS is counted
+in characters actually sent to ElevenLabs (cache hits are free). Each /api/*
+handler opens a scope with begin(endpoint, session_id, client) — the session
+comes from the client's X-Session-ID header — and call_router and the TTS paths
+record into it. Requests without a valid session id are accounted to a bucket
+derived from the client address ("anon-<digest>"), so leaving the header out
+doesn't escape the budgets. Figures are set on the span that incurred them, added to this worker's
+per-endpoint totals and to the session's totals.
+
+Session totals are aggregated in memory and flushed every
+KAI_USAGE_FLUSH_INTERVAL seconds (default 15) into a small SQLite table shared
+by all workers (KAI_USAGE_PATH, default <tmp>/kai-usage.sqlite3; "off" keeps them
+per worker), so a session's budget holds within one flush interval even when
+its requests land on different workers. Idle sessions are forgotten after
+KAI_USAGE_SESSION_TTL seconds (default 86400).
+
+Budgets (0 disables) degrade before they refuse:
+- KAI_SESSION_TOKEN_BUDGET (default 200000): past KAI_USAGE_SOFT_RATIO (0.8) of
+  it, chat endpoints send a shorter history; once spent they answer 429.
+- KAI_SESSION_TTS_CHAR_BUDGET (default 20000): past the soft ratio, long texts
+  (e.g. a summary read aloud) are no longer synthesized; once spent, or when a
+  text would overrun it, /api/tts answers 429 and the client carries on with
+  text only.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextvars import ContextVar
+
+from server.sqlite_store import LocalConnections, resolve_path
+from server.tracing import current_span
+
+logger = logging.getLogger("kai.usage")
+
+SESSION_HEADER = "X-Session-ID"
+DEGRADED_HEADER = "X-Kai-Degraded"
+
+FIELDS = ("requests", "prompt_tokens", "completion_tokens", "total_tokens", "tts_chars")
+
+_SESSION_ID = re.compile(r"[A-Za-z0-9._:-]{1,64}")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session TEXT PRIMARY KEY,
+    requests INTEGER NOT NULL DEFAULT 0,
+    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+    completion_tokens INTEGER NOT NULL DEFAULT 0,
+    total_tokens INTEGER NOT NULL DEFAULT 0,
+    tts_chars INTEGER NOT NULL DEFAULT 0,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated);
+"""
+
+_UPSERT = """
+INSERT INTO sessions (session, requests, prompt_tokens, completion_tokens, total_tokens, tts_chars, updated)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (session) DO UPDATE SET
+    requests = requests + excluded.requests,
+    prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+    completion_tokens = completion_tokens + excluded.completion_tokens,
+    total_tokens = total_tokens + excluded.total_tokens,
+    tts_chars = tts_chars + excluded.tts_chars,
+    updated = excluded.updated
+"""
+
+# (endpoint, session) of the request being handled
+_scope: ContextVar = ContextVar("kai_usage_scope", default=None)
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+def _zero():
+    return dict.fromkeys(FIELDS, 0)
+
+
+def _merge(into, delta):
+    for k, v in delta.items():
+        into[k] = into.get(k, 0) + v
+
+
+class UsageLedger:
+    def __init__(self, path=None, flush_interval=None, token_budget=None, tts_char_budget=None, soft_ratio=None, session_ttl=None):
+        self.path = resolve_path(path, "KAI_USAGE_PATH", "kai-usage.sqlite3")
+        self.flush_interval = flush_interval or float(os.getenv("KAI_USAGE_FLUSH_INTERVAL", "15"))
+        self.token_budget = int(os.getenv("KAI_SESSION_TOKEN_BUDGET", "200000")) if token_budget is None else token_budget
+        self.tts_char_budget = int(os.getenv("KAI_SESSION_TTS_CHAR_BUDGET", "20000")) if tts_char_budget is None else tts_char_budget
+        self.soft_ratio = soft_ratio or float(os.getenv("KAI_USAGE_SOFT_RATIO", "0.8"))
+        self.session_ttl = session_ttl or float(os.getenv("KAI_USAGE_SESSION_TTL", "86400"))
+        self._conns = LocalConnections(self.path, _SCHEMA)
+        self._lock = threading.Lock()
+        self.endpoints = {}
+        self._pending = {}   # session -> deltas not yet flushed
+        self._inflight = {}  # session -> deltas being flushed right now
+        self._flushed = {}   # session -> totals as of the last flush
+        self._seen = {}      # session -> last activity
+        self.degraded = {"short_history": 0, "tts_skipped": 0, "rejected": 0}
+        self.last_flush = None
+
+    @property
+    def shared(self):
+        return self.path is not None
+
+    def _conn(self):
+        return self._conns.get()
+
+    # --- Recording ---
+
+    def begin(self, endpoint, session_id=None, client=None):
+        """
+        Open the usage scope for the current request and return the session it is
+        accounted to: `session_id` if valid, else the anonymous bucket of `client`
+        (the client address; all address-less requests share one bucket).
+        """
+        if session_id and _SESSION_ID.fullmatch(session_id):
+            session = session_id
+        else:
+            session = "anon-" + hashlib.sha256((client or "").encode("utf-8")).hexdigest()[:16]
+        _scope.set((endpoint, session))
+        s = current_span()
+        if s is not None and session:
+            s.set("session.id", session)
+        self._add(endpoint, session, {"requests": 1})
+        return session
+
+    def _add(self, endpoint, session, delta):
+        with self._lock:
+            _merge(self.endpoints.setdefault(endpoint, _zero()), delta)
+            if session:
+                _merge(self._pending.setdefault(session, _zero()), delta)
+                self._seen[session] = time.time()
+
+    def record_tokens(self, usage):
+        """Account a router response's `usage` object to the current scope."""
+        if not isinstance(usage, dict):
+            return
+        delta = {}
+        for field in ("prompt_tokens", "completion_tokens", "total_tokens"):
+            try:
+                delta[field] = max(int(usage.get(field) or 0), 0)
+            except (TypeError, ValueError):
+                delta[field] = 0
+        if not delta["total_tokens"]:
+            delta["total_tokens"] = delta["prompt_tokens"] + delta["completion_tokens"]
+        s = current_span()
+        if s is not None:
+            for field, value in delta.items():
+                s.set(f"usage.{field}", value)
+        endpoint, session = _scope.get() or ("other", None)
+        self._add(endpoint, session, delta)
+
+    def record_tts_chars(self, chars, span=None):
+        s = span or current_span()
+        if s is not None:
+            s.set("usage.tts_chars", chars)
+        endpoint, session = _scope.get() or ("other", None)
+        self._add(endpoint, session, {"tts_chars": chars})
+
+    # --- Budgets ---
+
+    def session_totals(self, session):
+        totals = _zero()
+        with self._lock:
+            for source in (self._flushed, self._inflight, self._pending):
+                if session in source:
+                    _merge(totals, source[session])
+        return totals
+
+    def _note(self, kind):
+        with self._lock:
+            self.degraded[kind] += 1
+        s = current_span()
+        if s is not None:
+            s.set("usage.degraded", kind)
+
+    def history_limit(self, session, default, reduced):
+        """
+        History rows to send for `session`: `default` normally, `reduced` past the
+        soft token budget (second value True). Raises BudgetExceeded once spent.
+        """
+        if not session or not self.token_budget:
+            return default, False
+        used = self.session_totals(session)["total_tokens"]
+        if used >= self.token_budget:
+            self._note("rejected")
+            raise BudgetExceeded("Session token budget exhausted.")
+        if used >= self.token_budget * self.soft_ratio:
+            self._note("short_history")
+            return reduced if default is None else min(default, reduced), True
+        return default, False
+
+    def check_tts(self, session, chars, long_text):
+        """Raise BudgetExceeded if synthesizing `chars` more characters isn't allowed for `session`."""
+        if not session or not self.tts_char_budget:
+            return
+        used = self.session_totals(session)["tts_chars"]
+        if used + chars > self.tts_char_budget or (long_text and used >= self.tts_char_budget * self.soft_ratio):
+            self._note("tts_skipped")
+            raise BudgetExceeded("TTS budget exceeded for this session.")
+
+    # --- Flushing (blocking; run_flusher calls it from a worker thread) ---
+
+    def flush(self):
+        now = time.time()
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._inflight = pending
+            for session, seen in list(self._seen.items()):
+                if now - seen > self.session_ttl and session not in pending:
+                    del self._seen[session]
+                    self._flushed.pop(session, None)
+            active = list(self._seen)
+        totals = None
+        if self.shared:
+            try:
+                conn = self._conn()
+                conn.executemany(_UPSERT, [(s, *(d[f] for f in FIELDS), now) for s, d in pending.items()])
+                conn.execute("DELETE FROM sessions WHERE updated < ?", (now - self.session_ttl,))
+                totals = {}
+                for i in range(0, len(active), 500):
+                    batch = active[i:i + 500]
+                    rows = conn.execute(
+                        f"SELECT session, {', '.join(FIELDS)} FROM sessions WHERE session IN ({','.join('?' * len(batch))})",
+                        batch,
+                    )
+                    for row in rows:
+                        totals[row[0]] = dict(zip(FIELDS, row[1:]))
+            except sqlite3.Error as e:
+                logger.warning("Usage flush failed; keeping totals in memory: %s", e)
+                totals = None
+        with self._lock:
+            if totals is None:
+                for session, delta in pending.items():
+                    _merge(self._flushed.setdefault(session, _zero()), delta)
+            else:
+                for session in active:
+                    if session in totals:
+                        self._flushed[session] = totals[session]
+            self._inflight = {}
+            self.last_flush = now
+
+    async def run_flusher(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception:
+                logger.exception("Usage flush crashed")
+
+    # --- Metrics ---
+
+    def stats(self, top=10):
+        """Per-endpoint totals for this worker, budgets, degradations and the costliest sessions."""
+        with self._lock:
+            endpoints = {name: dict(t) for name, t in self.endpoints.items()}
+            sessions = {}
+            for source in (self._flushed, self._inflight, self._pending):
+                for session, t in source.items():
+                    _merge(sessions.setdefault(session, _zero()), t)
+            degraded = dict(self.degraded)
+            last_flush = self.last_flush
+        totals = _zero()
+        for t in endpoints.values():
+            _merge(totals, t)
+        costliest = sorted(sessions.items(), key=lambda item: (item[1]["total_tokens"], item[1]["tts_chars"]), reverse=True)
+        return {
+            "budgets": {
+                "session_tokens": self.token_budget,
+                "session_tts_chars": self.tts_char_budget,
+                "soft_ratio": self.soft_ratio,
+            },
+            "totals": totals,
+            "endpoints": endpoints,
+            "sessions": {
+                "tracked": len(sessions),
+                # Truncated: a full id would let anyone spend that session's budget
+                "top": [{"session": s[:8], **t} for s, t in costliest[:top]],
+            },
+            "degraded": degraded,
+            "shared": self.shared,
+            "last_flush": last_flush,
+        }
+
+
+ledger = UsageLedger()